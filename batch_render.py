@@ -0,0 +1,139 @@
+# batch_render.py
+# 🧩 Batch renderer: renders many world folders in one run, loading the shared inputs only once
+
+import os
+import csv
+import copy
+import time
+import argparse
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+from helper import Config, get_args, plan_memory_budget
+from main import load_version, output_suffix, load_shared_inputs, render_world
+
+SUMMARY_NAME = "batch_summary.csv"
+SUMMARY_FIELDS = ["world", "status", "world_size", "pois", "categories", "legend_entries", "seconds", "output_dir"]
+
+_batch_state = {}
+
+### 🧩 Batch CLI: --worlds plus any regular prefab2png option, which applies to every world
+def parse_batch_args(argv=None):
+	parser = argparse.ArgumentParser(
+		description="Render several 7DTD worlds in one run. All other options are the regular prefab2png flags (see main.py --help)."
+	)
+	parser.add_argument("--worlds", nargs="+", required=True, metavar="DIR", help="World folders, each containing prefabs.xml and biomes.png")
+	parser.add_argument("--world-jobs", type=int, default=1, help="Worlds rendered at the same time in separate processes (default: 1)")
+	parser.add_argument("--out", help="Batch output folder (default: batch--<version>--<flags>__<timestamp>)")
+	batch_args, rest = parser.parse_known_args(argv)
+
+	for world_dir in batch_args.worlds:
+		if not os.path.isdir(world_dir):
+			parser.error(f"World folder not found: {world_dir}")
+	if batch_args.world_jobs < 1:
+		parser.error("--world-jobs must be at least 1")
+	return batch_args, get_args(rest)
+
+def world_args(args, world_dir):
+	"""Copies the shared CLI args, pointing --xml and --biomes at one world folder."""
+	world = copy.copy(args)
+	world.xml = os.path.join(world_dir, "prefabs.xml")
+	world.biomes = os.path.join(world_dir, "biomes.png")
+	return world
+
+def world_output_dirs(worlds, batch_dir):
+	"""One output folder per world, named after the world folder (suffixed if names repeat)."""
+	seen = {}
+	dirs = []
+	for world_dir in worlds:
+		name = os.path.basename(os.path.normpath(world_dir)) or "world"
+		seen[name] = seen.get(name, 0) + 1
+		dirs.append(os.path.join(batch_dir, name if seen[name] == 1 else f"{name}_{seen[name]}"))
+	return dirs
+
+### 🧩 Shared State: Loaded once per process (the batch process, or each --world-jobs worker)
+def init_batch_worker(args, first_world, version):
+	config = Config(world_args(args, first_world))
+	started = time.time()
+	_batch_state.update(
+		args=args,
+		version=version,
+		shared=load_shared_inputs(config, args),
+		label_sprites=config.label_sprites,
+	)
+	config.image_writer.close()
+	return time.time() - started
+
+### 🧩 World Job: Renders one world with the shared inputs and reports its timing
+def render_batch_world(world_dir, output_dir):
+	args = world_args(_batch_state["args"], world_dir)
+	stats = {"world": world_dir, "output_dir": output_dir}
+	missing = [path for path in (args.xml, args.biomes) if not os.path.isfile(path)]
+	if missing:
+		stats.update(status=f"failed: missing {', '.join(os.path.basename(p) for p in missing)}")
+		return stats
+
+	print(f"\n🌍 Rendering world: {world_dir}")
+	config = Config(args)
+	try:
+		args.world_size = config.world_size
+		plan_memory_budget(args, config.image_size)
+		config.label_sprites = _batch_state["label_sprites"]
+		config.output_dir = output_dir
+		stats.update(render_world(config, _batch_state["shared"], _batch_state["version"]))
+		stats["status"] = "ok"
+	except Exception as e:
+		stats["status"] = f"failed: {e}"
+		print(f"❌ {world_dir}: {e}")
+	finally:
+		config.image_writer.close()
+	return stats
+
+def write_summary(batch_dir, rows):
+	path = os.path.join(batch_dir, SUMMARY_NAME)
+	with open(path, "w", encoding="utf-8", newline="") as f:
+		writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS, extrasaction="ignore")
+		writer.writeheader()
+		for row in rows:
+			row = dict(row)
+			if "seconds" in row:
+				row["seconds"] = f"{row['seconds']:.2f}"
+			writer.writerow(row)
+	return path
+
+def main():
+	start_time = time.time()
+	batch_args, args = parse_batch_args()
+	version = load_version()
+	batch_dir = batch_args.out or f"batch--{version}--{output_suffix(args)}"
+	os.makedirs(batch_dir, exist_ok=True)
+	output_dirs = world_output_dirs(batch_args.worlds, batch_dir)
+	print(f"📁 Batch output directory: {batch_dir} ({len(batch_args.worlds)} worlds)")
+
+	if batch_args.world_jobs > 1:
+		if args.jobs > 1:
+			print("ℹ️  --world-jobs > 1: rendering categories serially inside each world (--jobs 1).")
+			args.jobs = 1
+		with ProcessPoolExecutor(
+			max_workers=batch_args.world_jobs,
+			initializer=init_batch_worker,
+			initargs=(args, batch_args.worlds[0], version)
+		) as pool:
+			futures = [pool.submit(render_batch_world, world, out) for world, out in zip(batch_args.worlds, output_dirs)]
+			rows = [future.result() for future in futures]
+		print("✅ Shared inputs loaded once per worker process.")
+	else:
+		shared_seconds = init_batch_worker(args, batch_args.worlds[0], version)
+		print(f"✅ Shared inputs loaded once in {shared_seconds:.2f} seconds.")
+		rows = [render_batch_world(world, out) for world, out in zip(batch_args.worlds, output_dirs)]
+
+	# === Summary ===
+	summary_path = write_summary(batch_dir, rows)
+	print("\n📊 Batch summary:")
+	for row in rows:
+		seconds = f"{row['seconds']:.2f}s" if "seconds" in row else "-"
+		print(f"   • {row['world']}: {row['status']} ({seconds}, {row.get('pois', 0)} POIs)")
+	print(f"📝 Timing report: {summary_path}")
+	print(f"🕒 Batch completed in {time.time() - start_time:.2f} seconds")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,84 @@
+# check_placement.py
+# 🧩 Placement check: batched plans must match the sequential sweep, and streets/player_starts never fall back to pass 4 or the legend
+
+import sys
+import random
+from PIL import Image, ImageDraw
+from helper import Config, get_args
+from parse import extract_blue_zones
+from render import place_category_labels
+from main import LABEL_MASK_RED, LABEL_MASK_BLUE
+from placement import LEGEND_PASS
+
+WORLD_SIZE = 1024
+GREEN = (40, 120, 40)
+
+### 🧩 Synthetic Layer: Random POIs with a red block, optionally with blue zones beside it
+def synthetic_mask(with_blue_zones):
+	size = WORLD_SIZE + 1
+	mask = Image.new("RGB", (size, size), GREEN)
+	draw = ImageDraw.Draw(mask)
+	draw.rectangle((300, 300, 700, 700), fill=LABEL_MASK_RED)
+	if with_blue_zones:
+		draw.rectangle((720, 300, 820, 420), fill=LABEL_MASK_BLUE)
+		draw.rectangle((180, 600, 280, 700), fill=LABEL_MASK_BLUE)
+	return mask
+
+def synthetic_points(count, seed):
+	rng = random.Random(seed)
+	points = []
+	for i in range(count):
+		# Every third POI sits in the red block
+		if i % 3 == 0:
+			x, z = rng.randint(320, 680), rng.randint(320, 680)
+		else:
+			x, z = rng.randint(10, WORLD_SIZE - 10), rng.randint(10, WORLD_SIZE - 10)
+		points.append((f"P{i:04d}", f"poi_{i % 40}", x, z))
+	return points
+
+def plan_entries(placement, category, points, display_names, mask, blue_zones):
+	config = Config(get_args(["--world-size", str(WORLD_SIZE), "--placement", placement, "--no-cache"]))
+	plan = place_category_labels(
+		category, points, config, display_names, mask, blue_zones,
+		LABEL_MASK_RED, LABEL_MASK_BLUE, log=lambda message: None
+	)
+	return plan["entries"]
+
+def main():
+	display_names = {f"poi_{i}": f"Point of Interest {i}" for i in range(40)}
+	cases = [
+		("no mask", None, False),
+		("red zone with blue zones", synthetic_mask(True), True),
+		("red zone without blue zones", synthetic_mask(False), False),
+	]
+	failed = False
+	for label, mask, with_blue_zones in cases:
+		blue_zones = extract_blue_zones(mask, LABEL_MASK_BLUE) if with_blue_zones else []
+		points = synthetic_points(300, seed=len(label))
+		sweep = plan_entries("sweep", "biome_desert", points, display_names, mask, blue_zones)
+		batched = plan_entries("batched", "biome_desert", points, display_names, mask, blue_zones)
+		mismatches = [i for i, (a, b) in enumerate(zip(sweep, batched)) if a != b]
+		passes = sorted({entry["pass"] for entry in sweep})
+		if mismatches or len(sweep) != len(batched):
+			failed = True
+			first = mismatches[0] if mismatches else min(len(sweep), len(batched))
+			print(f"❌ {label}: batched differs from sweep at entry {first} ({len(mismatches)} mismatches)")
+		else:
+			print(f"✅ {label}: batched matches sweep ({len(sweep)} POIs, passes {passes})")
+
+	# Streets and player_starts only ever get direct labels or a bare dot
+	mask = synthetic_mask(False)
+	points = synthetic_points(300, seed=0)
+	for category in ("streets", "player_starts"):
+		for placement in ("sweep", "batched"):
+			entries = plan_entries(placement, category, points, display_names, mask, [])
+			passes = sorted({entry["pass"] for entry in entries})
+			if {"4", LEGEND_PASS} & set(passes):
+				failed = True
+				print(f"❌ {category} ({placement}): plan contains passes {passes}")
+			else:
+				print(f"✅ {category} ({placement}): passes {passes}")
+	return 1 if failed else 0
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,100 @@
+# compositor.py
+# 🧩 Layer compositors: build the combined map as each category layer finishes, in memory or by strips
+
+import numpy as np
+from PIL import Image
+from image_writer import open_strip_writer
+
+### 🧩 Layer Compositor: Premultiplied "over" blending into one preallocated canvas buffer
+class LayerCompositor:
+	"""
+	Holds the combined map as a single preallocated premultiplied-alpha (RGBa) buffer.
+	add() blends a layer over the buffer, touching only the layer's own region,
+	so cropped (--sparse) layers cost only their size. image() converts back to RGBA.
+	"""
+	def __init__(self, size):
+		width, height = size
+		self.size = (width, height)
+		self.buffer = np.zeros((height, width, 4), dtype=np.uint8)
+		self.layers_added = 0
+
+	def add(self, layer, offset=(0, 0)):
+		"""Composites an RGBA layer (or its crop placed at offset) over the canvas."""
+		x, y = offset
+		width, height = self.size
+		x1, y1 = max(x, 0), max(y, 0)
+		x2, y2 = min(x + layer.width, width), min(y + layer.height, height)
+		if x1 >= x2 or y1 >= y2:
+			return
+		if (x1, y1, x2, y2) != (x, y, x + layer.width, y + layer.height):
+			layer = layer.crop((x1 - x, y1 - y, x2 - x, y2 - y))
+
+		blend_over(self.buffer[y1:y2, x1:x2], np.asarray(layer.convert("RGBA").convert("RGBa")))
+		self.layers_added += 1
+
+	def image(self):
+		"""Returns the combined canvas as a straight-alpha RGBA image."""
+		return Image.fromarray(self.buffer, "RGBa").convert("RGBA")
+
+	def save(self, path, image_writer):
+		"""Queues the combined canvas on the background writer as a "final" output."""
+		image_writer.save(self.image(), path, "final")
+
+def blend_over(dst, src):
+	"""Blends premultiplied src over premultiplied dst in place (both uint8 RGBa arrays)."""
+	# dst = src + dst * (255 - src_alpha) / 255, rounded, in 16-bit integer math
+	scaled = dst.astype(np.uint16)
+	scaled *= (255 - src[..., 3:4]).astype(np.uint16)
+	scaled += 128
+	scaled += scaled >> 8
+	scaled >>= 8
+	scaled += src
+	dst[...] = scaled
+
+### 🧩 Strip Compositor: Keeps only visible pieces per band and streams the combine to disk
+class StripCompositor:
+	"""
+	Same add() interface as LayerCompositor, but never allocates the full canvas.
+	Each added layer is cut into horizontal bands and only the visible part of each
+	band is kept (palette layers are kept as palette pieces). save() composites one band at a time and streams it through a
+	strip encoder, so peak memory is one band plus the visible layer pieces.
+	"""
+	def __init__(self, size, band_height=512):
+		self.size = tuple(size)
+		self.band_height = band_height
+		self.pieces = [[] for _ in range(-(-self.size[1] // band_height))]
+		self.layers_added = 0
+
+	def add(self, layer, offset=(0, 0)):
+		x, y = offset
+		width, height = self.size
+		y1, y2 = max(y, 0), min(y + layer.height, height)
+		if x >= width or x + layer.width <= 0 or y1 >= y2:
+			return
+		if layer.mode not in ("RGBA", "P"):
+			layer = layer.convert("RGBA")
+		# Palette layers stay palette pieces until their band is composited
+		alpha = layer.convert("RGBA").getchannel("A") if layer.mode == "P" else layer.getchannel("A")
+		for band in range(y1 // self.band_height, (y2 - 1) // self.band_height + 1):
+			top = band * self.band_height
+			bottom = min(top + self.band_height, height)
+			crop = (0, max(top, y1) - y, layer.width, min(bottom, y2) - y)
+			piece = layer.crop(crop)
+			bbox = alpha.crop(crop).getbbox()
+			if bbox is None:
+				continue
+			piece_offset = (x + bbox[0], max(top, y1) + bbox[1] - top)
+			self.pieces[band].append((piece.crop(bbox), piece_offset))
+		self.layers_added += 1
+
+	def save(self, path, image_writer):
+		"""Composites band by band into a strip PNG/TIFF at the writer's "final" level."""
+		width, height = self.size
+		level = image_writer.levels["final"]
+		with open_strip_writer(path, self.size, "RGBA", level) as writer:
+			for band, pieces in enumerate(self.pieces):
+				top = band * self.band_height
+				strip = LayerCompositor((width, min(self.band_height, height - top)))
+				for piece, offset in pieces:
+					strip.add(piece, offset)
+				writer.write(np.asarray(strip.image()))
@@ -1,19 +1,57 @@
-from PIL import Image, ImageEnhance, ImageDraw
+from PIL import Image, ImageEnhance
 import numpy as np
 import os
 from datetime import datetime
 import argparse
+import hashlib
+import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from image_writer import open_strip_writer
+from helper import detect_world_size
+from render_cache import file_digest
 
 # Create timestamped output folder
 timestamp = datetime.now().strftime("%Y-%m-%d_%H%M")
 output_dir = f"output_terrain_{timestamp}"
 os.makedirs(output_dir, exist_ok=True)
 
+def parse_rgb(value):
+	try:
+		rgb = tuple(int(part) for part in value.split(","))
+	except ValueError:
+		rgb = ()
+	if len(rgb) != 3 or not all(0 <= c <= 255 for c in rgb):
+		raise argparse.ArgumentTypeError(f"Expected R,G,B with values 0-255, got: {value}")
+	return rgb
+
 ### 🧩 Directory CLI: Accepts one folder path to find RAW, biome, and splat3 files
 def parse_args():
 	parser = argparse.ArgumentParser(description="Generate terrain map from world directory")
 	parser.add_argument("--dir", required=True, help="Path to world folder (must contain dtm_processed.raw, biomes.png, splat3_processed.png)")
-	return parser.parse_args()
+	parser.add_argument("--world-size", type=int, help="World edge length in blocks (default: detected from dtm_processed.raw)")
+	parser.add_argument("--format", choices=["png", "tiff"], default="png", help="Output image format (default: png)")
+	parser.add_argument("--strip-height", type=int, default=512, help="Rows shaded, composited and encoded per block; bounds peak memory (default: 512)")
+	parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Threads shading blocks in parallel (default: CPU count)")
+	parser.add_argument("--asphalt-color", type=parse_rgb, default=(94, 93, 94), metavar="R,G,B", help="Major road color (default: 94,93,94, terrAsphalt)")
+	parser.add_argument("--gravel-color", type=parse_rgb, default=(116, 109, 100), metavar="R,G,B", help="Minor road color (default: 116,109,100, gravel; sand is 116,113,92)")
+	parser.add_argument("--brightness", type=float, default=1.2, help="Final brightness multiplier, applied before the +32 lift (default: 1.2)")
+	parser.add_argument("--gamma", type=float, default=1.2, help="Hillshade gamma; higher softens the shading contrast (default: 1.2)")
+	parser.add_argument("--contour-interval", type=int, default=600, help="Height units between contour lines; try 800 or 1000 for large-scale maps (default: 600)")
+	parser.add_argument("--hillshade-opacity", type=float, default=0.4, help="Hillshade strength from 0 (none) to 1; 0.2-0.5 works well (default: 0.4)")
+	parser.add_argument("--sun-azimuth", type=float, default=315, help="Sun direction in degrees, clockwise from north (default: 315, NW)")
+	parser.add_argument("--sun-altitude", type=float, default=45, help="Sun height above the horizon in degrees (default: 45)")
+	parser.add_argument("--compression", type=int, choices=range(0, 10), default=6, metavar="0-9", help="zlib level for the output; 9 is smaller but much slower, lower is faster while tuning (default: 6)")
+	parser.add_argument("--cache-dir", default=".prefab2png_cache", metavar="DIR", help="Folder for cached terrain intermediates (default: .prefab2png_cache)")
+	parser.add_argument("--no-cache", action="store_true", help="Don't read or write cached terrain intermediates")
+	args = parser.parse_args()
+	if args.contour_interval < 1:
+		parser.error("--contour-interval must be at least 1")
+	if not 0 <= args.hillshade_opacity <= 1:
+		parser.error("--hillshade-opacity must be between 0 and 1")
+	if args.gamma <= 0:
+		parser.error("--gamma must be positive")
+	return args
 
 output_path = "terrain_biome_shaded_final.png"
 
@@ -28,29 +66,54 @@ for path in [raw_path, biome_path, splat_path]:
 	if not os.path.exists(path):
 		raise FileNotFoundError(f"Missing required file: {path}")
 
-# Map Size, change as necessary for larger worlds
-map_size = 6144
+# Map Size: --world-size, else detected from the RAW length / biomes.png / prefabs.xml
+if args.world_size:
+	map_size = args.world_size
+else:
+	map_size, size_source = detect_world_size(raw_path, biome_path, os.path.join(world_dir, "prefabs.xml"))
+	print(f"🌍 World size: {map_size} (from {size_source})")
 
-# Load heightmap
-with open(raw_path, "rb") as f:
-	raw_data = f.read()
-print(f"Loaded RAW: {len(raw_data)} bytes")
+# Memory-map the heightmap: rows are read from disk as each block needs them
+expected_bytes = map_size * map_size * 2
+raw_bytes = os.path.getsize(raw_path)
+print(f"Mapped RAW: {raw_bytes} bytes")
 
 # Validate size
-if len(raw_data) != 6144 * 6144 * 2:
-	raise ValueError("RAW file size does not match expected 6144x6144 uint16 format.")
-
-# Decode and flip heightmap vertically to test RWG slot alignment
-height_data = np.frombuffer(raw_data, dtype=np.uint16).reshape((6144, 6144))
-height_data = np.flipud(height_data)
-height_normalized = (height_data - height_data.min()) / np.ptp(height_data)
-
-# Load biome image
-biome_img = Image.open(biome_path).convert("RGB")
-if biome_img.size != (6144, 6144):
-	print(f"Resizing biome map from {biome_img.size} to 6144x6144...")
-	biome_img = biome_img.resize((6144, 6144), Image.Resampling.NEAREST)
-biome_array = np.array(biome_img)
+if raw_bytes != expected_bytes:
+	raise ValueError(f"RAW file size does not match expected {map_size}x{map_size} uint16 format.")
+
+# Flip heightmap vertically to test RWG slot alignment (a view, nothing is copied)
+height_data = np.memmap(raw_path, dtype="<u2", mode="r", shape=(map_size, map_size))[::-1]
+block_rows = max(1, args.strip_height)
+
+def row_blocks(halo=0):
+	"""Yields (top, bottom, halo_top, halo_bottom) for each block of rows, with `halo` extra rows each side."""
+	for top in range(0, map_size, block_rows):
+		bottom = min(top + block_rows, map_size)
+		yield top, bottom, max(top - halo, 0), min(bottom + halo, map_size)
+
+### 🧩 Intermediates Cache: Parameter-independent arrays stored as .npy, keyed by the input file hashes
+TERRAIN_CACHE_VERSION = 1
+cache_dir = None if args.no_cache else os.path.join(args.cache_dir, "terrain")
+
+def cached_array(name, inputs, build):
+	"""
+	Returns build()'s array, reusing <cache_dir>/terrain/<name>-<key>.npy (memory-mapped)
+	when the same inputs built it before. inputs must be JSON-serializable.
+	"""
+	if cache_dir is None:
+		return build()
+	key = hashlib.sha256(json.dumps([TERRAIN_CACHE_VERSION, name, map_size, inputs]).encode("utf-8")).hexdigest()[:32]
+	path = os.path.join(cache_dir, f"{name}-{key}.npy")
+	if os.path.exists(path):
+		print(f"♻️ Reusing cached {name}")
+		return np.load(path, mmap_mode="r")
+	array = build()
+	os.makedirs(cache_dir, exist_ok=True)
+	tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+	np.save(tmp_path, array)
+	os.replace(tmp_path, path)
+	return array
 
 # Biome colors (with names for logging)
 biomes = {
@@ -61,140 +124,188 @@ biomes = {
 	"Wasteland":    {"color": (255, 168, 0), "shade": (181, 224, 57)}
 }
 
-from scipy.spatial import KDTree
-
-# Build color list and KDTree from biome definitions
 biome_names = list(biomes.keys())
 biome_colors = [biomes[name]["color"] for name in biome_names]
 biome_shades = [biomes[name]["shade"] for name in biome_names]
-tree = KDTree(biome_colors)
-
-# Flatten biome image and map each pixel to nearest biome color
-flat_pixels = biome_array.reshape((-1, 3))
-_, idx = tree.query(flat_pixels)
-biome_indices = idx.reshape((6144, 6144))
-
-# Render base shaded terrain
-output = np.zeros((6144, 6144, 3), dtype=np.uint8)
-matches_found = 0
-brightness = 1.4
-gamma = 0.9
-
-### 🧩 Enhanced Elevation Mapping: Boost midrange terrain contrast using log + equalization hybrid
-elev_shift = height_data - height_data.min() + 1
-log_scaled = np.log(elev_shift)
-log_norm = (log_scaled - log_scaled.min()) / np.ptp(log_scaled)
-
-# Histogram equalization of log-normalized data
-hist, bins = np.histogram(log_norm.flatten(), bins=256, range=(0, 1), density=True)
-cdf = hist.cumsum()
-cdf_normalized = (cdf - cdf.min()) / np.ptp(cdf)
-height_brightness = np.interp(log_norm.flatten(), bins[:-1], cdf_normalized).reshape(log_norm.shape)
-
-for i, name in enumerate(biome_names):
-	mask = biome_indices == i
-	count = np.count_nonzero(mask)
-	matches_found += count
-	print(f"{name}: {count} pixels")
 
-	shade = biome_shades[i]
-	for c in range(3):
-		val = height_brightness[mask] * shade[c]
-		output[..., c][mask] = np.clip(val, 0, 255).astype(np.uint8)
+### 🧩 Biome Classifier: Nearest biome color per distinct pixel color, mapped back through a packed-RGB lookup table
+def pack_rgb(rgb):
+	rgb = rgb.astype(np.uint32)
+	return (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+
+def classify_biomes():
+	biome_img = Image.open(biome_path).convert("RGB")
+	if biome_img.size != (map_size, map_size):
+		print(f"Resizing biome map from {biome_img.size} to {map_size}x{map_size}...")
+		biome_img = biome_img.resize((map_size, map_size), Image.Resampling.NEAREST)
+
+	# biomes.png holds a handful of distinct colors: classify only those (first nearest wins ties)
+	unique_colors = np.array([color for _, color in biome_img.getcolors(1 << 24)], dtype=np.int32)
+	distances = ((unique_colors[:, None, :] - np.array(biome_colors, dtype=np.int32)[None, :, :]) ** 2).sum(axis=-1)
+	biome_lut = np.zeros(1 << 24, dtype=np.uint8)
+	biome_lut[pack_rgb(unique_colors)] = distances.argmin(axis=1)
+	print(f"Classified {len(unique_colors)} distinct biome colors")
+
+	biome_array = np.asarray(biome_img)
+	biome_indices = np.empty((map_size, map_size), dtype=np.uint8)
+	for top, bottom, _, _ in row_blocks():
+		biome_indices[top:bottom] = biome_lut[pack_rgb(biome_array[top:bottom])]
+	return biome_indices
+
+biome_indices = cached_array("biome_indices", [file_digest(biome_path), biome_colors], classify_biomes)
+
+### 🧩 Height Statistics: Two streaming passes for the global min/max and the log-height histogram
+def log_normalize(block, height_min, log_span):
+	"""Log-scaled height of a block of rows, normalized to 0..1 over the whole map."""
+	return np.log(block.astype(np.float32) - height_min + 1) / log_span
+
+def height_statistics():
+	"""Returns [height_min, height_max, *equalization CDF (256 values)] as one float64 array."""
+	height_min, height_max = 65535, 0
+	for top, bottom, _, _ in row_blocks():
+		block = height_data[top:bottom]
+		height_min = min(height_min, int(block.min()))
+		height_max = max(height_max, int(block.max()))
+
+	# Log scale in float32, as np.log() of the uint16 heights gives; log(1) = 0 at the lowest point
+	log_span = np.log(np.float32(height_max - height_min + 1))
+	counts = np.zeros(256, dtype=np.int64)
+	for top, bottom, _, _ in row_blocks():
+		counts += np.histogram(log_normalize(height_data[top:bottom], height_min, log_span), bins=bins)[0]
+
+	### 🧩 Enhanced Elevation Mapping: Boost midrange terrain contrast using log + equalization hybrid
+	# Same values as np.histogram(..., density=True) over the whole map
+	hist = counts / np.diff(bins) / counts.sum()
+	cdf = hist.cumsum()
+	cdf_normalized = (cdf - cdf.min()) / np.ptp(cdf)
+	return np.concatenate(([height_min, height_max], cdf_normalized))
+
+bins = np.linspace(0, 1, 257)
+height_stats = cached_array("height_stats", [file_digest(raw_path)], height_statistics)
+height_min, height_max = int(height_stats[0]), int(height_stats[1])
+cdf_normalized = np.array(height_stats[2:])
+log_span = np.log(np.float32(height_max - height_min + 1))
 
 # Contour settings
-contour_interval = 600  # space between lines (try 800 or 1000 for large-scale maps)
+contour_interval = args.contour_interval  # space between lines
 contour_thickness = 1   # how many vertical units wide
 contour_color = (200, 200, 200)  # soft gray, not white
 
-# Create mask for thin contour band
-contour_mask = np.logical_and(
-	(height_data % contour_interval) < contour_thickness,
-	height_data > 0  # skip flat terrain
-)
-
 # Blend contour color instead of hard overwrite
 blend_strength = 0.25  # 0 = no effect, 1 = full line color
 
-for c in range(3):
-	base = output[..., c].astype(np.float32)
-	contour_layer = contour_color[c]
-	output[..., c][contour_mask] = np.clip(
-		(1 - blend_strength) * base[contour_mask] + blend_strength * contour_layer,
-		0, 255
-	).astype(np.uint8)
-
-### 🧩 Directional Hillshading: Adds sun angle for 3D terrain shading
-gradient_x, gradient_y = np.gradient(height_data.astype(np.float32))
+# Light source direction (default: sun from NW at 45°)
+azimuth_rad = np.radians(args.sun_azimuth)
+altitude_rad = np.radians(args.sun_altitude)
 
-# Compute slope and aspect
-slope_rad = np.arctan(np.hypot(gradient_x, gradient_y))
-aspect_rad = np.arctan2(gradient_y, -gradient_x)
-
-# Light source direction — sun from NW at 45°
-azimuth_rad = np.radians(315)
-altitude_rad = np.radians(45)
-
-# Hillshade using cosine law
-hillshade = (
-	np.sin(altitude_rad) * np.cos(slope_rad) +
-	np.cos(altitude_rad) * np.sin(slope_rad) * np.cos(azimuth_rad - aspect_rad)
-)
-hillshade = np.clip(hillshade, 0, 1)
+# Final brighten for visual clarity
+brightness = args.brightness
 
 # Soft floor to prevent pure black shadows in valleys
 min_hillshade = 0.3  # Raise this to brighten shadows (e.g. 0.2 → 0.4)
-hillshade = np.clip(hillshade, min_hillshade, 1.0)
-
-hillshade = (hillshade * 255).astype(np.uint8)
 
 # Apply gamma correction to soften hillshade contrast
-hillshade_gamma = 1.2
-hillshade_corrected = 255 * ((hillshade / 255.0) ** hillshade_gamma)
-hillshade_corrected = hillshade_corrected.astype(np.uint8)
+hillshade_gamma = args.gamma
 
 # LERP blend: soften the hillshade influence
-hillshade_opacity = 0.4  # Adjust 0.2–0.5 for lighter/darker terrain
-
-for c in range(3):
-	base = output[..., c].astype(np.float32)
-	shadow = base * (hillshade_corrected / 255.0)
-	output[..., c] = np.clip(
-		(1 - hillshade_opacity) * base + hillshade_opacity * shadow,
-		0, 255
-	).astype(np.uint8)
-
-# Nonlinear remap — emphasize mid elevations
-height_brightness = np.clip(np.sqrt(height_normalized), 0, 1)
-
-# Final output brighten for visual clarity
-output = np.clip(output * 1.2 + 32, 0, 255).astype(np.uint8)
-
-### 🧩 Roads Overlay from Splat3: Adds major and minor roads to the final image
+hillshade_opacity = args.hillshade_opacity
+
+### 🧩 Shading Tables: Everything that depends on one value alone is computed once per value
+# Equalized brightness per uint16 height (only heights present on the map are filled)
+height_range = np.arange(height_min, height_max + 1, dtype=np.uint16)
+brightness_lut = np.zeros(65536, dtype=np.float32)
+brightness_lut[height_min:height_max + 1] = np.interp(log_normalize(height_range, height_min, log_span), bins[:-1], cdf_normalized)
+
+# Thin contour band per height
+all_heights = np.arange(65536)
+contour_lut = ((all_heights % contour_interval) < contour_thickness) & (all_heights > 0)  # skip flat terrain
+
+# Hillshade factor per 8-bit hillshade: gamma correction, then the LERP towards the shadowed color
+hillshade_levels = np.arange(256)
+hillshade_corrected = (255 * ((hillshade_levels / 255.0) ** hillshade_gamma)).astype(np.uint8)
+hillshade_lut = ((1 - hillshade_opacity) + hillshade_opacity * (hillshade_corrected / 255.0)).astype(np.float32)
+
+shade_table = np.array(biome_shades, dtype=np.float32)
+sun_x = np.float32(-np.cos(altitude_rad) * np.cos(azimuth_rad))
+sun_y = np.float32(np.cos(altitude_rad) * np.sin(azimuth_rad))
+sun_z = np.float32(np.sin(altitude_rad))
+
+### 🧩 Block Shader: Fused biome shading, contours, hillshade and final brighten for rows top..bottom
+def shade_block(top, bottom, halo_top, halo_bottom, out):
+	"""
+	Shades rows top..bottom into out[..., :3] (uint8) and returns the pixel count per
+	biome. Per channel: shade-table gather by biome index times equalized brightness,
+	contour blend, hillshade and brighten, in float32 with two block-sized scratch
+	buffers. Each stage truncates to whole values like the uint8 stages it replaces.
+	The hillshade gradient is taken over halo_top..halo_bottom (one extra row each
+	side) so block edges match a full-map pass. Only reads shared state, so blocks
+	can run on several threads.
+	"""
+	heights = np.asarray(height_data[top:bottom])
+	block_biomes = biome_indices[top:bottom]
+	biome_counts = np.bincount(block_biomes.ravel(), minlength=len(biome_names))
+
+	height_brightness = brightness_lut[heights]
+	contour_mask = contour_lut[heights]
+
+	### 🧩 Directional Hillshading: cosine law from the gradient, no slope/aspect angles needed
+	# cos(slope) = 1/|n|, sin(slope)·cos(azimuth - aspect) = (sin(az)·gy - cos(az)·gx)/|n|, |n| = sqrt(1 + gx² + gy²)
+	gradient_x, gradient_y = np.gradient(height_data[halo_top:halo_bottom].astype(np.float32))
+	rows = slice(top - halo_top, bottom - halo_top)
+	gradient_x, gradient_y = gradient_x[rows], gradient_y[rows]
+	hillshade = gradient_x * sun_x
+	hillshade += gradient_y * sun_y
+	hillshade += sun_z
+	np.square(gradient_x, out=gradient_x)
+	np.square(gradient_y, out=gradient_y)
+	gradient_x += gradient_y
+	gradient_x += 1
+	np.sqrt(gradient_x, out=gradient_x)
+	hillshade /= gradient_x
+	# Soft floor to prevent pure black shadows in valleys
+	np.clip(hillshade, min_hillshade, 1.0, out=hillshade)
+	hillshade *= 255
+	hillshade_factor = hillshade_lut[hillshade.astype(np.uint8)]
+
+	value, scratch = gradient_x, gradient_y  # Reused as the per-channel buffers
+	for c in range(3):
+		np.take(shade_table[:, c], block_biomes, out=value)
+		value *= height_brightness
+		np.floor(value, out=value)
+
+		# Blend contour color instead of hard overwrite
+		np.multiply(value, 1 - blend_strength, out=scratch)
+		scratch += blend_strength * contour_color[c]
+		np.floor(scratch, out=scratch)
+		np.copyto(value, scratch, where=contour_mask)
+
+		value *= hillshade_factor
+		np.floor(value, out=value)
+
+		# Final output brighten for visual clarity
+		value *= brightness
+		value += 32
+		np.minimum(value, 255, out=value)
+		out[..., c] = value
+
+	return biome_counts
+
+### 🧩 Roads Overlay from Splat3: Classifies road pixels once; each band paints them with masked assignment
+ROAD_NONE, ROAD_ASPHALT, ROAD_GRAVEL = 0, 1, 2
+def classify_roads():
+	splat_img = Image.open(splat_path).convert("RGB").resize((map_size, map_size), Image.NEAREST)
+	splat_data = np.asarray(splat_img)
+
+	# Major roads: Red channel > 128; minor roads: Green channel > 128 (drawn over major roads)
+	road_classes = np.zeros((map_size, map_size), dtype=np.uint8)
+	road_classes[splat_data[..., 0] > 128] = ROAD_ASPHALT
+	road_classes[splat_data[..., 1] > 128] = ROAD_GRAVEL
+	return road_classes
+
+road_classes = None
 if os.path.exists(splat_path):
 	print(f"🛣️ Adding roads from: {splat_path}")
-	splat_img = Image.open(splat_path).convert("RGB").resize((6144, 6144), Image.NEAREST)
-	splat_data = np.array(splat_img)
-
-	# Create transparent overlay
-	roads_overlay = Image.new("RGBA", (6144, 6144), (0, 0, 0, 0))
-	draw = ImageDraw.Draw(roads_overlay)
-
-	# Major roads: Red channel > 128
-	red_mask = splat_data[..., 0] > 128
-	red_coords = np.column_stack(np.where(red_mask))
-	for y, x in red_coords:
-		draw.point((x, y), fill=(94, 93, 94))  # terrAsphalt
-
-	# Minor roads: Green channel > 128
-	green_mask = splat_data[..., 1] > 128
-	green_coords = np.column_stack(np.where(green_mask))
-	for y, x in green_coords:
-		draw.point((x, y), fill=(116, 109, 100))  # Gravel, else use Sand: (116, 113, 92)
-
-	# Composite on top of final image
-	final_img = Image.fromarray(output).convert("RGBA")
-	final_img.alpha_composite(roads_overlay)
+	road_classes = cached_array("road_classes", [file_digest(splat_path)], classify_roads)
 else:
 	print("⚠️ Roads overlay skipped (splat3_processed.png not found)")
 
@@ -219,8 +330,37 @@ else:
 	print("⚠️ Radiation map not found, skipping radiation overlay.")
 """
 
-# Save composite
-output_path = os.path.join(output_dir, "terrain_biome_shaded_final.png")
-final_img.save(output_path)
+### 🧩 Band Renderer: Shades one block of rows and paints its roads (runs on a worker thread)
+def render_band(top, bottom, halo_top, halo_bottom):
+	band = np.empty((bottom - top, map_size, 4), dtype=np.uint8)
+	band[..., 3] = 255
+	biome_counts = shade_block(top, bottom, halo_top, halo_bottom, band)
+	if road_classes is not None:
+		roads = road_classes[top:bottom]
+		band[roads == ROAD_ASPHALT, :3] = args.asphalt_color
+		band[roads == ROAD_GRAVEL, :3] = args.gravel_color
+	return band, biome_counts
+
+### 🧩 Strip Output: Bands are rendered on a thread pool (NumPy releases the GIL) and streamed to disk in order
+output_path = os.path.join(output_dir, f"terrain_biome_shaded_final.{args.format}")
+jobs = max(1, args.jobs)
+biome_counts = np.zeros(len(biome_names), dtype=np.int64)
+print(f"🧵 Shading {map_size} rows in blocks of {block_rows} on {jobs} thread(s)...")
+with open_strip_writer(output_path, (map_size, map_size), "RGBA", args.compression) as writer, \
+		ThreadPoolExecutor(max_workers=jobs) as pool:
+	# At most two bands per thread in flight, so memory stays bounded while the writer catches up
+	pending = deque()
+	for block in row_blocks(halo=1):
+		pending.append(pool.submit(render_band, *block))
+		if len(pending) >= 2 * jobs:
+			band, counts = pending.popleft().result()
+			writer.write(band)
+			biome_counts += counts
+	while pending:
+		band, counts = pending.popleft().result()
+		writer.write(band)
+		biome_counts += counts
+
+for name, count in zip(biome_names, biome_counts):
+	print(f"{name}: {count} pixels")
 print(f"✅ Saved: {output_path}")
-
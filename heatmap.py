@@ -1,18 +1,17 @@
 import os
 from PIL import Image, ImageDraw, ImageFont, ImageOps
-from helper import load_prefabs_from_xml, should_exclude, transform_coords
-from parse import args, Config
+from helper import load_prefabs_from_xml, should_exclude, transform_coords, get_args, Config
 import time
 
 # === Setup ===
+args = get_args()
 config = Config(args)
 prefabs = load_prefabs_from_xml(config.xml_path)
 output_dir = "heatmap"
-image_width = 6145
-image_height = 6145
+image_width, image_height = config.image_size
 
 # === Filter loaded prefabs ===
-filtered_prefabs = [p for p in prefabs if not should_exclude(p[1])]
+filtered_prefabs = [p for p in prefabs if not should_exclude(p["name"])]
 print(f"✅ Prefabs after filtering: {len(filtered_prefabs)}")
 prefabs = filtered_prefabs
 
@@ -28,8 +27,9 @@ try:
 except:
 	font = ImageFont.load_default()
 
-for poi_id, name, x, z in prefabs:
-	px, pz = transform_coords(x, z)
+for prefab in prefabs:
+	poi_id = prefab["poi_id"]
+	px, pz = transform_coords(prefab["x"], prefab["z"], config.map_center)
 	current = heatmap.getpixel((px, pz))
 	for dx in range(-30, 31):
 		for dz in range(-30, 31):
@@ -42,8 +42,8 @@ for poi_id, name, x, z in prefabs:
 
 # === Save ===
 os.makedirs(output_dir, exist_ok=True)
-heatmap_path = os.path.join(config.output_dir, "heatmap.png")
-overlay_path = os.path.join(config.output_dir, "heatmap_overlay.png")
+heatmap_path = os.path.join(output_dir, "heatmap.png")
+overlay_path = os.path.join(output_dir, "heatmap_overlay.png")
 rgb_heatmap = Image.new("RGB", (image_width, image_height), "black")
 
 import numpy as np
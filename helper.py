@@ -13,16 +13,21 @@
 # - Split label placement vs drawing logic cleanly
 # - Optional: auto-generation of red/blue zones based on POI clustering (v0.6+)
 
-from PIL import ImageFont
+from PIL import Image, ImageFont
 import os
+import math
 import datetime
 import platform
 import csv
 import re
 import xml.etree.ElementTree as ET
 from filters import BLOCK_CATEGORY_ALIASES
+from labeler import get_font_metrics
+from image_writer import ImageWriter
+from sprites import LabelSpriteCache
 
 VALID_BIOMES = {"pine_forest", "desert", "snow", "burnt_forest", "wasteland"}
+DEFAULT_WORLD_SIZE = 6144  # Navezgane
 
 def get_version():
 	try:
@@ -36,8 +41,6 @@ class Config:
 	_paths_logged = False  # idempotent guard
 	def __init__(self, args):
 		self.args = args
-		self.image_size = (6145, 6145)
-		self.map_center = 3072
 		self.dot_radius = 4
 		self.font_size = args.text_size
 		self.label_padding = 4
@@ -45,7 +48,18 @@ class Config:
 		self.output_dir = None
 		self.combined_dir = None
 		self.log_dir = None
+		self.layer_entries = {}
+		self.mask_digest = None  # SHA-256 of the label mask in use, for cache and placement plan keys
+		self.image_writer = ImageWriter(levels={
+			"layer": getattr(args, "layer_compression", 1),
+			"final": getattr(args, "final_compression", 9),
+		})
+		self.cache_dir = None if getattr(args, "no_cache", False) else getattr(args, "cache_dir", None)
+		self.label_sprites = LabelSpriteCache(os.path.join(self.cache_dir, "label_sprites") if self.cache_dir else None)
 		self.xml_path, self.localization_path, self.biome_path, self.prefab_dir = self.resolve_paths()
+		self.world_size, self.world_size_source = self.resolve_world_size()
+		self.image_size = (self.world_size + 1, self.world_size + 1)  # world spans -size/2..+size/2 inclusive
+		self.map_center = self.world_size // 2
 		self.font_path = self.resolve_font_path()
 		self.font = self.load_font()
 
@@ -55,6 +69,7 @@ class Config:
 		self.excluded_log = None
 		self.debug_extended = self.args.extended_placement_debug
 		self.verbose = args.verbose
+		self.placement = getattr(args, "placement", "sweep")
 
 	def resolve_paths(self):
 		if platform.system() == "Windows":
@@ -82,6 +97,13 @@ class Config:
 		self.default_blocks_path = default_blocks
 		return xml, localization, biomes, prefab_dir
 		
+	### 🧩 World Size: --world-size wins, otherwise detected from the world folder's files
+	def resolve_world_size(self):
+		if getattr(self.args, "world_size", None):
+			return self.args.world_size, "--world-size"
+		raw_path = os.path.join(os.path.dirname(self.xml_path), "dtm_processed.raw")
+		return detect_world_size(raw_path, self.biome_path, self.xml_path)
+
 	### 🧩 Log Resolved Paths Once: avoids duplicate "Resolved paths" spam
 	def log_resolved_paths_once(self, log=print):
 		if Config._paths_logged:
@@ -96,6 +118,7 @@ class Config:
 			log(f"   • Localization:  {self.localization_path}")
 			log(f"   • Biomes:        {self.biome_path}")
 			log(f"   • Prefab Dir:    {self.prefab_dir}")
+		log(f"🌍 World size: {self.world_size} (from {self.world_size_source})")
 
 	def resolve_font_path(self):
 		return "C:\\Windows\\Fonts\\arial.ttf" if platform.system() == "Windows" else "/System/Library/Fonts/Supplemental/Arial.ttf"
@@ -139,6 +162,11 @@ parser.add_argument(
 	action="store_true",
 	help="Generate combined PNG layers."
 )
+parser.add_argument(
+	"--skip-category-combined",
+	action="store_true",
+	help="With --combined, don't write per-category *_combined.png files; the full combined map is still built in memory."
+)
 parser.add_argument(
 	"--with-player-starts",
 	action="store_true",
@@ -181,6 +209,91 @@ parser.add_argument(
 	action="store_true",
 	help="Highlight labels placed during extended placement (Pass 4)"
 )
+parser.add_argument(
+	"--placement",
+	choices=["sweep", "batched", "freespace"],
+	default="sweep",
+	help="Label placement engine. 'sweep' tests candidates one at a time; 'batched' scores each POI's full pass 1-4 candidate set in one NumPy pass (same results); 'freespace' jumps to the nearest free area that fits the label."
+)
+parser.add_argument(
+	"--sparse",
+	action="store_true",
+	help="Crop each points/labels/combined layer to its visible pixels and record canvas offsets in layers.json."
+)
+parser.add_argument(
+	"--palette-layers",
+	nargs="?",
+	const="lossless",
+	choices=("lossless", "quantize"),
+	help="Write points/labels/combined layer PNGs as palette (P) images for smaller files; layers are still rendered as RGBA. "
+		"'lossless' (the default when given without a value) keeps layers with more than 256 colors as RGBA; "
+		"'quantize' reduces those to 256 colors (anti-aliased label edges may shift slightly)."
+)
+parser.add_argument(
+	"--layer-compression",
+	type=int,
+	choices=range(0, 10),
+	default=1,
+	metavar="0-9",
+	help="PNG zlib level for intermediate layers (points, labels, per-category combined). Default is 1 (fast)."
+)
+parser.add_argument(
+	"--final-compression",
+	type=int,
+	choices=range(0, 10),
+	default=9,
+	metavar="0-9",
+	help="PNG zlib level for final deliverables (legend, full combined map, sticker overlay). Default is 9 (smallest)."
+)
+parser.add_argument(
+	"--strip-height",
+	type=int,
+	default=0,
+	metavar="ROWS",
+	help="With --combined, composite and encode the full combined map in horizontal strips of ROWS rows instead of one in-memory canvas. 0 (default) disables streaming."
+)
+parser.add_argument(
+	"--cache-dir",
+	default=".prefab2png_cache",
+	metavar="DIR",
+	help="Folder for caches kept between runs, such as rasterized label sprites (default: .prefab2png_cache)."
+)
+parser.add_argument(
+	"--cache-max-mb",
+	type=int,
+	default=4096,
+	metavar="MB",
+	help="Size cap for the layer cache in --cache-dir; least recently used entries are removed past it. 0 disables the cap (default: 4096)."
+)
+parser.add_argument(
+	"--no-cache",
+	action="store_true",
+	help="Don't read or write the on-disk caches in --cache-dir."
+)
+parser.add_argument(
+	"--reuse-placement",
+	metavar="DIR",
+	help="Draw labels from the placement plans saved in a previous output folder (DIR/placement/<category>.json) instead of running passes 1-4. Only for style changes: categories whose points, names, font, mask or placement settings changed are placed again."
+)
+parser.add_argument(
+	"--world-size",
+	type=int,
+	metavar="BLOCKS",
+	help="World edge length in blocks (e.g. 6144, 8192). Default: detected from dtm_processed.raw, biomes.png or prefabs.xml next to --xml."
+)
+parser.add_argument(
+	"--memory-budget",
+	type=int,
+	default=0,
+	metavar="MB",
+	help="Peak memory to plan full-canvas buffers for. When exceeded, --combined streams by strips and --jobs is lowered. Default: 75%% of physical memory."
+)
+parser.add_argument(
+	"--jobs",
+	type=int,
+	default=1,
+	help="Number of worker processes used to render category layers in parallel. Default is 1 (render in-process)."
+)
 parser.add_argument(
 	"--text-size",
 	type=int,
@@ -212,8 +325,8 @@ parser.add_argument(
 	help="Choose rendering mode (default/test1/xyz/yxz/etc)"
 )
 
-def get_args():
-	args = parser.parse_args()
+def get_args(argv=None):
+	args = parser.parse_args(argv)
 # ----------------------------------------------
 # ✅ CLI arg validation
 # ----------------------------------------------
@@ -231,6 +344,22 @@ def get_args():
 		if path_arg and not os.path.isfile(path_arg):
 			parser.error(f"{label} file not found: {path_arg}")
 	
+	# --jobs
+	if args.jobs < 1:
+		parser.error("--jobs must be at least 1")
+
+	# --strip-height
+	if args.strip_height < 0:
+		parser.error("--strip-height must be 0 or a positive row count")
+
+	# --reuse-placement
+	if args.reuse_placement and not os.path.isdir(args.reuse_placement):
+		parser.error(f"Placement plan folder not found: {args.reuse_placement}")
+
+	# --world-size
+	if args.world_size is not None and args.world_size < 1:
+		parser.error("--world-size must be a positive number of blocks")
+
 	# --text-size
 	if args.text_size > 60:
 		args.text_size = 60
@@ -242,7 +371,7 @@ def get_args():
 # ----------------------------------------------
 
 def get_text_box(text, x, y, font, padding=4):
-	bbox = font.getbbox(text)
+	bbox = get_font_metrics(font).bbox(text)
 	text_w = bbox[2] - bbox[0]
 	text_h = bbox[3] - bbox[1]
 	return (
@@ -290,7 +419,7 @@ def is_placeable(label_box, label_mask, red_rgb):
 def try_green_zone_label(text, base_x, base_y, font, mask, occupied_boxes, red_rgb):
 	if mask is None:
 			return None
-	bbox = font.getbbox(text)
+	bbox = get_font_metrics(font).bbox(text)
 	text_w = bbox[2] - bbox[0]
 	text_h = bbox[3] - bbox[1]
 	pad = 4
@@ -384,6 +513,82 @@ def should_exclude(name):
 		return True
 	return False
 # ----------------------------------------------
+# ✅ World size + memory planning
+# ----------------------------------------------
+
+### 🧩 World Size Detection: RAW heightmap length, then biomes.png, then prefab extents
+def detect_world_size(raw_path=None, biome_path=None, xml_path=None):
+	"""
+	Returns (world_size, source). dtm_processed.raw is size² uint16 samples and
+	biomes.png is size² pixels; either is only trusted when it is large enough for
+	the prefab positions in prefabs.xml. Without those files the prefab extents are
+	rounded up to the next 1024 blocks.
+	"""
+	minimum = 0
+	if xml_path and os.path.isfile(xml_path):
+		prefabs = load_prefabs_from_xml(xml_path)
+		if prefabs:
+			extent = max(max(abs(p["x"]), abs(p["z"])) for p in prefabs)
+			minimum = math.ceil((2 * extent + 1) / 1024) * 1024
+
+	if raw_path and os.path.isfile(raw_path):
+		length = os.path.getsize(raw_path)
+		side = math.isqrt(length // 2)
+		if side * side * 2 == length and side >= minimum:
+			return side, os.path.basename(raw_path)
+
+	if biome_path and os.path.isfile(biome_path):
+		with Image.open(biome_path) as img:
+			width, height = img.size
+		if width == height and width >= minimum:
+			return width, os.path.basename(biome_path)
+
+	if minimum:
+		return minimum, "prefab extents"
+	return DEFAULT_WORLD_SIZE, "default"
+
+def physical_memory_mb():
+	"""Total physical memory in MB, or None where os.sysconf can't report it (Windows)."""
+	try:
+		return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2**20
+	except (AttributeError, ValueError, OSError):
+		return None
+
+### 🧩 Memory Preflight: Falls back to strip output and fewer jobs when canvases won't fit
+def plan_memory_budget(args, image_size, log=print):
+	"""
+	Estimates peak memory for the render phase (points, labels and combined
+	canvases per job, the biome map and label mask, and the in-memory combined
+	map) and adjusts args in place until it fits args.memory_budget.
+	Returns the final estimate in MB.
+	"""
+	budget = args.memory_budget
+	if not budget:
+		physical = physical_memory_mb()
+		if physical is None:
+			return None
+		budget = physical * 3 // 4
+
+	canvas_mb = image_size[0] * image_size[1] * 4 / 2**20
+	shared_mb = canvas_mb * 1.5  # RGB biome map + RGB label mask
+
+	def estimate():
+		compositor_mb = canvas_mb if args.combined and not args.strip_height else 0
+		return args.jobs * 3 * canvas_mb + shared_mb + compositor_mb
+
+	if estimate() > budget and args.combined and not args.strip_height:
+		args.strip_height = 512
+		log(f"🧠 Memory budget {budget} MB: streaming the combined map in 512-row strips.")
+
+	if estimate() > budget and args.jobs > 1:
+		args.jobs = max(1, int((budget - shared_mb) // (3 * canvas_mb)))
+		log(f"🧠 Memory budget {budget} MB: lowering --jobs to {args.jobs}.")
+
+	if estimate() > budget:
+		log(f"⚠️ Estimated peak {estimate():.0f} MB exceeds the {budget} MB memory budget.")
+	return estimate()
+
+# ----------------------------------------------
 # ✅ Normalize coordinates
 # ----------------------------------------------
 def transform_coords(x, z, map_center=3072):
@@ -0,0 +1,243 @@
+# image_writer.py
+# 🧩 Background image writer: encodes PNGs on a thread pool so rendering doesn't wait on zlib
+
+import os
+import struct
+import threading
+import zlib
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# zlib level per kind of output: intermediate layers favor speed, deliverables favor size
+COMPRESSION_LEVELS = {
+	"layer": 1,
+	"final": 9,
+}
+
+### 🧩 Image Writer: Queues img.save() calls on worker threads with per-output compression
+class ImageWriter:
+	"""
+	Encodes and writes images on a thread pool (Pillow releases the GIL while encoding).
+	At most max_pending images are held in the queue; save() blocks beyond that so
+	large canvases don't pile up in memory. Call flush() before reading files back
+	and at the end of the run; it re-raises the first failed save. The thread pool
+	is only started on the first save().
+	"""
+	def __init__(self, max_workers=None, max_pending=None, levels=None):
+		self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+		self.levels = dict(COMPRESSION_LEVELS, **(levels or {}))
+		self._pool = None
+		self._slots = threading.Semaphore(max_pending or self.max_workers * 2)
+		self._futures = []
+
+	def save(self, img, path, kind="layer", **params):
+		"""
+		Queues img to be written to path. kind selects the compression level from
+		self.levels ("layer" or "final"). The image must not be modified afterwards.
+		"""
+		if path.lower().endswith(".png"):
+			params.setdefault("compress_level", self.levels.get(kind, self.levels["layer"]))
+		if self._pool is None:
+			self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="image-writer")
+		self._slots.acquire()
+		future = self._pool.submit(self._write, img, path, params)
+		self._futures.append(future)
+		return future
+
+	def _write(self, img, path, params):
+		try:
+			img.save(path, **params)
+			return path
+		finally:
+			self._slots.release()
+
+	def flush(self):
+		"""Waits for every queued write and returns the written paths."""
+		futures, self._futures = self._futures, []
+		wait(futures)
+		return [future.result() for future in futures]
+
+	def close(self):
+		try:
+			self.flush()
+		finally:
+			if self._pool is not None:
+				self._pool.shutdown(wait=True)
+				self._pool = None
+
+### 🧩 Strip PNG Writer: Streams horizontal bands of rows straight into a PNG file
+class StripPNGWriter:
+	"""
+	Writes a PNG from successive (rows, width, channels) uint8 bands, so the full
+	image never has to exist in memory. Rows use the PNG "Sub" filter and are
+	deflated incrementally into IDAT chunks.
+	"""
+	COLOR_TYPES = {"RGB": (2, 3), "RGBA": (6, 4)}
+
+	def __init__(self, path, size, mode="RGBA", compress_level=6):
+		if mode not in self.COLOR_TYPES:
+			raise ValueError(f"Unsupported strip mode: {mode}")
+		color_type, self.channels = self.COLOR_TYPES[mode]
+		self.path = path
+		self.width, self.height = size
+		self.rows_written = 0
+		self._compressor = zlib.compressobj(compress_level)
+		self._file = open(path, "wb")
+		self._file.write(b"\x89PNG\r\n\x1a\n")
+		self._chunk(b"IHDR", struct.pack(">IIBBBBB", self.width, self.height, 8, color_type, 0, 0, 0))
+
+	def _chunk(self, tag, data):
+		self._file.write(struct.pack(">I", len(data)) + tag + data)
+		self._file.write(struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF))
+
+	def write(self, rows):
+		rows = np.ascontiguousarray(rows, dtype=np.uint8)
+		count = rows.shape[0]
+		if rows.shape[1:] != (self.width, self.channels):
+			raise ValueError(f"Band shape {rows.shape} does not match {self.width}x{self.channels}")
+		if self.rows_written + count > self.height:
+			raise ValueError(f"Too many rows for {self.path}: {self.rows_written + count} > {self.height}")
+
+		flat = rows.reshape(count, -1)
+		c = self.channels
+		filtered = np.empty((count, flat.shape[1] + 1), dtype=np.uint8)
+		filtered[:, 0] = 1  # Sub filter
+		filtered[:, 1:c + 1] = flat[:, :c]
+		np.subtract(flat[:, c:], flat[:, :-c], out=filtered[:, c + 1:])
+
+		data = self._compressor.compress(filtered.tobytes())
+		if data:
+			self._chunk(b"IDAT", data)
+		self.rows_written += count
+
+	def close(self):
+		try:
+			if self.rows_written != self.height:
+				raise ValueError(f"{self.path}: wrote {self.rows_written} of {self.height} rows")
+			self._chunk(b"IDAT", self._compressor.flush())
+			self._chunk(b"IEND", b"")
+		finally:
+			self._file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		if exc_type is None:
+			self.close()
+		else:
+			self._file.close()
+
+### 🧩 Strip TIFF Writer: Streams deflate-compressed strips, writing the IFD at the end
+class StripTIFFWriter:
+	"""
+	Writes a baseline little-endian TIFF from successive bands. Incoming rows are
+	grouped into fixed RowsPerStrip strips, each deflated and written immediately;
+	the directory with strip offsets is appended once all rows are in.
+	"""
+	CHANNELS = {"RGB": 3, "RGBA": 4}
+
+	def __init__(self, path, size, mode="RGBA", compress_level=6, rows_per_strip=64):
+		if mode not in self.CHANNELS:
+			raise ValueError(f"Unsupported strip mode: {mode}")
+		self.channels = self.CHANNELS[mode]
+		self.path = path
+		self.width, self.height = size
+		self.rows_per_strip = rows_per_strip
+		self.compress_level = compress_level
+		self.rows_written = 0
+		self._pending = []
+		self._pending_rows = 0
+		self._offsets = []
+		self._counts = []
+		self._file = open(path, "wb")
+		self._file.write(b"II*\x00" + struct.pack("<I", 0))  # IFD offset patched on close
+
+	def _emit_strip(self, rows):
+		data = zlib.compress(np.ascontiguousarray(rows).tobytes(), self.compress_level)
+		self._offsets.append(self._file.tell())
+		self._counts.append(len(data))
+		self._file.write(data)
+
+	def write(self, rows):
+		rows = np.asarray(rows, dtype=np.uint8)
+		if rows.shape[1:] != (self.width, self.channels):
+			raise ValueError(f"Band shape {rows.shape} does not match {self.width}x{self.channels}")
+		if self.rows_written + rows.shape[0] > self.height:
+			raise ValueError(f"Too many rows for {self.path}")
+		self.rows_written += rows.shape[0]
+		self._pending.append(rows)
+		self._pending_rows += rows.shape[0]
+		if self._pending_rows >= self.rows_per_strip:
+			buffered = np.concatenate(self._pending) if len(self._pending) > 1 else self._pending[0]
+			full = (self._pending_rows // self.rows_per_strip) * self.rows_per_strip
+			for y in range(0, full, self.rows_per_strip):
+				self._emit_strip(buffered[y:y + self.rows_per_strip])
+			rest = buffered[full:]
+			self._pending = [rest] if len(rest) else []
+			self._pending_rows = len(rest)
+
+	def _write_array(self, fmt, values):
+		offset = self._file.tell()
+		self._file.write(struct.pack(f"<{len(values)}{fmt}", *values))
+		return offset
+
+	def close(self):
+		try:
+			if self.rows_written != self.height:
+				raise ValueError(f"{self.path}: wrote {self.rows_written} of {self.height} rows")
+			if self._pending:
+				self._emit_strip(np.concatenate(self._pending))
+				self._pending = []
+			if self._file.tell() % 2:
+				self._file.write(b"\x00")
+
+			SHORT, LONG = 3, 4
+			bits_offset = self._write_array("H", [8] * self.channels)
+			offsets_offset = self._write_array("I", self._offsets)
+			counts_offset = self._write_array("I", self._counts)
+			strips = len(self._offsets)
+			entries = [
+				(256, LONG, 1, self.width),
+				(257, LONG, 1, self.height),
+				(258, SHORT, self.channels, bits_offset),
+				(259, SHORT, 1, 8),  # Adobe deflate
+				(262, SHORT, 1, 2),  # RGB
+				(273, LONG, strips, self._offsets[0] if strips == 1 else offsets_offset),
+				(277, SHORT, 1, self.channels),
+				(278, LONG, 1, self.rows_per_strip),
+				(279, LONG, strips, self._counts[0] if strips == 1 else counts_offset),
+				(284, SHORT, 1, 1),  # Chunky
+			]
+			if self.channels == 4:
+				entries.append((338, SHORT, 1, 2))  # Unassociated alpha
+
+			if self._file.tell() % 2:
+				self._file.write(b"\x00")
+			ifd_offset = self._file.tell()
+			self._file.write(struct.pack("<H", len(entries)))
+			for tag, kind, count, value in entries:
+				if kind == SHORT and count == 1:
+					self._file.write(struct.pack("<HHIHH", tag, kind, count, value, 0))
+				else:
+					self._file.write(struct.pack("<HHII", tag, kind, count, value))
+			self._file.write(struct.pack("<I", 0))
+			self._file.seek(4)
+			self._file.write(struct.pack("<I", ifd_offset))
+		finally:
+			self._file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		if exc_type is None:
+			self.close()
+		else:
+			self._file.close()
+
+def open_strip_writer(path, size, mode="RGBA", compress_level=6):
+	"""Returns a StripTIFFWriter for .tif/.tiff paths, otherwise a StripPNGWriter."""
+	if path.lower().endswith((".tif", ".tiff")):
+		return StripTIFFWriter(path, size, mode, compress_level)
+	return StripPNGWriter(path, size, mode, compress_level)
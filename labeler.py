@@ -1,6 +1,6 @@
 # labeler.py
 import os
-placed_bounding_boxes = [] # Global list of placed bounding boxes: (poi_id, layer, (x1, y1, x2, y2))
+import numpy as np
 
 def boxes_overlap(box1, box2):
 	"""Return True if two filled rectangles overlap in any way, including touching."""
@@ -33,32 +33,81 @@ def check_dot_overlap(candidate_box, dot_centers, dot_radius=5, stroke_width=2):
 	
 	return False
 
+### 🧩 Font Metrics Cache: Memoizes line height, text bboxes and wrapped lines per font
+class FontMetrics:
+	"""
+	Caches font.getbbox() results and wrap_label() output for a single font,
+	so each string is measured once per run no matter how many passes test it.
+	"""
+	def __init__(self, font):
+		self.font = font
+		self._bboxes = {}
+		self._wrapped = {}
+		self._line_height = None
+
+	def bbox(self, text):
+		bbox = self._bboxes.get(text)
+		if bbox is None:
+			bbox = self._bboxes[text] = tuple(self.font.getbbox(text))
+		return bbox
+
+	def width(self, text):
+		return self.bbox(text)[2]
+
+	@property
+	def line_height(self):
+		if self._line_height is None:
+			bbox = self.bbox("Ay")
+			self._line_height = bbox[3] - bbox[1]
+		return self._line_height
+
+	def wrap(self, text, max_width):
+		key = (text, max_width)
+		lines = self._wrapped.get(key)
+		if lines is None:
+			words = text.split()
+			lines = []
+			current = ""
+			for word in words:
+				trial = f"{current} {word}".strip()
+				if self.width(trial) > max_width and current:
+					lines.append(current)
+					current = word
+				else:
+					current = trial
+			if current:
+				lines.append(current)
+			lines = self._wrapped[key] = tuple(lines)
+		return lines
+
+_font_metrics = {}
+
+def font_cache_key(font):
+	"""(font file, size, face index) for TrueType fonts; id(font) for fonts without a file."""
+	path = getattr(font, "path", None)
+	return (path, getattr(font, "size", None), getattr(font, "index", 0)) if path else id(font)
+
+def get_font_metrics(font):
+	"""Returns the shared FontMetrics for a font, keyed by (font file, size)."""
+	key = font_cache_key(font)
+	metrics = _font_metrics.get(key)
+	if metrics is None:
+		metrics = _font_metrics[key] = FontMetrics(font)
+	return metrics
+
 def wrap_label(text, font, max_width):
 	"""
 	Word-wraps a label string to fit within max_width using the provided font.
 	"""
-	words = text.split()
-	lines = []
-	current = ""
-	for word in words:
-		trial = f"{current} {word}".strip()
-		width = font.getbbox(trial)[2]
-		if width > max_width and current:
-			lines.append(current)
-			current = word
-		else:
-			current = trial
-	if current:
-		lines.append(current)
-	return lines
+	return list(get_font_metrics(font).wrap(text, max_width))
 
 def get_text_box(x, y, lines, font, padding=4):
 	"""
 	Returns bounding box [x1, y1, x2, y2] for a list of lines at (x, y).
 	"""
-	max_line_width = max(font.getbbox(line)[2] for line in lines)
-	line_height = font.getbbox("Ay")[3] - font.getbbox("Ay")[1]
-	total_height = len(lines) * line_height
+	metrics = get_font_metrics(font)
+	max_line_width = max(metrics.width(line) for line in lines)
+	total_height = len(lines) * metrics.line_height
 	return [
 		x - padding,
 		y - padding,
@@ -96,7 +145,8 @@ def find_label_position_near_dot(dot_px, dot_pz, display, font, label_mask, red_
 	text_y = dot_pz + pad + 9
 	
 	# Wrap the label and calculate height for vertical offset
-	line_height = font.getbbox("Ay")[3] - font.getbbox("Ay")[1]
+	metrics = get_font_metrics(font)
+	line_height = metrics.line_height
 	# Vertical spacing uses line height (e.g. ~12-14px typically)
 	vertical_offsets = [i * line_height for i in (0, 1, -1, 2, -2, 3, -3, 4, -4)]
 	wrapped = wrap_label(display, font, max_width=200)
@@ -114,7 +164,7 @@ def find_label_position_near_dot(dot_px, dot_pz, display, font, label_mask, red_
 	# Pass 2: horizontal fallback : try horizontal placement using label width as nudge size
 	# This calculates the total width of the wrapped label
 	log(f"Trying horizontal fallback for {display}") #debug
-	max_line_width = max((font.getbbox(line)[2] - font.getbbox(line)[0]) for line in wrapped)
+	max_line_width = max((metrics.bbox(line)[2] - metrics.bbox(line)[0]) for line in wrapped)
 	step = max_line_width // 2
 	horizontal_offsets = [i * step for i in (1, -1, 2, -2, 3, -3, 4, -4)]
 	for dx in horizontal_offsets:
@@ -148,9 +198,10 @@ def extended_green_zone_search(dot_px, dot_pz, display, font, label_mask, red_rg
 	pad = 4
 	text_x = dot_px + pad + 5
 	text_y = dot_pz + pad + 9
-	line_height = font.getbbox("Ay")[3] - font.getbbox("Ay")[1]
+	metrics = get_font_metrics(font)
+	line_height = metrics.line_height
 	wrapped = wrap_label(display, font, max_width=200)
-	max_line_width = max((font.getbbox(line)[2] for line in wrapped), default=100)
+	max_line_width = max((metrics.width(line) for line in wrapped), default=100)
 	
 	# 🔁 More accurate vertical throw
 	box_height = line_height * len(wrapped) + 2 * pad
@@ -190,35 +241,401 @@ def extended_green_zone_search(dot_px, dot_pz, display, font, label_mask, red_rg
 	log(f"❌ Pass 4 failed for {display}")
 	return None
 
-def find_label_position_in_blue_zone(dot_px, dot_pz, display, font, blue_zones, zone_stack_tops, label_mask, red_rgb):
+_mask_classes = {}
+
+def mask_class_raster(label_mask, red_rgb, blue_rgb=None):
 	"""
-	Tries to find a blue zone near the dot to place the label.
-	Returns (label_x, label_y, wrapped_lines, label_box) or None if no placement possible.
+	Returns a uint8 raster of the label mask with PlacementIndex.MASK_RED and
+	MASK_BLUE marking red/blue pixels. Built once per mask and shared by every category.
+	"""
+	key = (id(label_mask), tuple(red_rgb), tuple(blue_rgb) if blue_rgb else None)
+	cached = _mask_classes.get(key)
+	if cached is not None and cached[0] is label_mask:
+		return cached[1]
+
+	rgb = np.asarray(label_mask.convert("RGB"))
+	r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+	classes = np.zeros(rgb.shape[:2], dtype=np.uint8)
+	classes[(r == red_rgb[0]) & (g == red_rgb[1]) & (b == red_rgb[2])] = PlacementIndex.MASK_RED
+	if blue_rgb:
+		classes[(r == blue_rgb[0]) & (g == blue_rgb[1]) & (b == blue_rgb[2])] = PlacementIndex.MASK_BLUE
+	_mask_classes[key] = (label_mask, classes)
+	return classes
+
+### 🧩 Batched Placement Index: Scores every pass 1-4 candidate for a POI in one NumPy sweep
+class PlacementIndex:
 	"""
-	best_zone = None
-	min_dist = float("inf")
+	Per-category placement state for --placement batched.
+	Holds the label mask as a red/blue class raster, the placed label boxes and
+	the dot centers as arrays, and evaluates the whole pass 1-4 candidate ladder
+	at once. The first valid candidate in pass order wins, matching the results
+	of find_label_position_near_dot() followed by extended_green_zone_search().
+	"""
+	MASK_RED = 1
+	MASK_BLUE = 2
+
+	def __init__(self, label_mask, red_rgb, blue_rgb, dot_centers, dot_radius=5, stroke_width=2, red_corner_tolerance=2):
+		self.mask_classes = mask_class_raster(label_mask, red_rgb, blue_rgb) if label_mask else None
+		self.red_corner_tolerance = red_corner_tolerance
+		self.dot_buffer = dot_radius + stroke_width
+		self.dots = np.asarray(dot_centers, dtype=np.int64).reshape(-1, 2)
+		self.boxes = np.empty((64, 4), dtype=np.int64)
+		self.box_count = 0
+
+	def add_box(self, box):
+		"""Registers a placed label box so later candidates avoid it."""
+		if self.box_count == len(self.boxes):
+			self.boxes = np.concatenate([self.boxes, np.empty_like(self.boxes)])
+		self.boxes[self.box_count] = box
+		self.box_count += 1
+
+	def build_candidates(self, dot_px, dot_pz, wrapped, metrics, max_range=10):
+		"""
+		Returns (xs, ys, passes) for every label origin tried by passes 1-4, in the
+		same order the sequential passes visit them.
+		"""
+		pad = 4
+		text_x = dot_px + pad + 5
+		text_y = dot_pz + pad + 9
+		line_height = metrics.line_height
+		xs, ys, passes = [], [], []
+
+		def add(x, y, pass_no):
+			xs.append(x)
+			ys.append(y)
+			passes.append(pass_no)
+
+		# Pass 1: vertical
+		for i in (0, 1, -1, 2, -2, 3, -3, 4, -4):
+			add(text_x, text_y + i * line_height, 1)
+
+		# Pass 2: horizontal
+		max_line_width = max((metrics.bbox(line)[2] - metrics.bbox(line)[0]) for line in wrapped)
+		step = max_line_width // 2
+		for i in (1, -1, 2, -2, 3, -3, 4, -4):
+			add(dot_px + i * step + pad, text_y, 2)
+
+		# Pass 3: diagonal
+		for offset in range(1, 5):
+			dx = step * offset
+			dy = line_height * offset
+			for sign_x, sign_y in [(-1, -1), (-1, 1), (1, -1), (1, 1)]:
+				add(dot_px + sign_x * dx + pad, dot_pz + sign_y * dy + pad + 4, 3)
+
+		# Pass 4: extended range
+		half_width = max((metrics.width(line) for line in wrapped), default=100) // 2
+		box_height = line_height * len(wrapped) + 2 * pad
+		for offset in range(5, max_range + 1):
+			for dy in [offset * box_height, -offset * box_height]:
+				add(text_x, text_y + dy, 4)
+			for dx in [offset * half_width, -offset * half_width]:
+				add(dot_px + dx + pad, text_y, 4)
+			dx = offset * half_width
+			dy = offset * line_height
+			for sign_x, sign_y in [(-1, -1), (-1, 1), (1, -1), (1, 1)]:
+				add(dot_px + sign_x * dx + pad, dot_pz + sign_y * dy + pad + 4, 4)
+
+		return np.array(xs, dtype=np.int64), np.array(ys, dtype=np.int64), np.array(passes)
+
+	def valid_candidates(self, boxes):
+		"""Returns a boolean array marking which (N, 4) candidate boxes are placeable."""
+		x1, y1, x2, y2 = boxes.T
+		valid = np.ones(len(boxes), dtype=bool)
+
+		# Mask: same four-corner test as is_placeable()
+		if self.mask_classes is not None:
+			height, width = self.mask_classes.shape
+			red_corners = np.zeros(len(boxes), dtype=np.int64)
+			for cx, cy in ((x1, y1), (x2, y1), (x1, y2), (x2, y2)):
+				inside = (cx >= 0) & (cx < width) & (cy >= 0) & (cy < height)
+				classes = np.zeros(len(boxes), dtype=np.uint8)
+				classes[inside] = self.mask_classes[cy[inside], cx[inside]]
+				red_corners += classes == self.MASK_RED
+				valid &= classes != self.MASK_BLUE
+			valid &= red_corners <= self.red_corner_tolerance
+
+		envelope = (x1.min(), y1.min(), x2.max(), y2.max())
+
+		# Placed labels: same strict overlap as boxes_overlap()
+		placed = self.boxes[:self.box_count]
+		near = placed[
+			(placed[:, 0] < envelope[2]) & (placed[:, 2] > envelope[0]) &
+			(placed[:, 1] < envelope[3]) & (placed[:, 3] > envelope[1])
+		]
+		if len(near):
+			hits = (
+				(x1[:, None] < near[None, :, 2]) & (x2[:, None] > near[None, :, 0]) &
+				(y1[:, None] < near[None, :, 3]) & (y2[:, None] > near[None, :, 1])
+			)
+			valid &= ~hits.any(axis=1)
+
+		# Dots: same inclusive buffer test as check_dot_overlap()
+		b = self.dot_buffer
+		dots = self.dots[
+			(self.dots[:, 0] + b >= envelope[0]) & (self.dots[:, 0] - b <= envelope[2]) &
+			(self.dots[:, 1] + b >= envelope[1]) & (self.dots[:, 1] - b <= envelope[3])
+		]
+		if len(dots):
+			hits = ~(
+				(x2[:, None] < dots[None, :, 0] - b) | (x1[:, None] > dots[None, :, 0] + b) |
+				(y2[:, None] < dots[None, :, 1] - b) | (y1[:, None] > dots[None, :, 1] + b)
+			)
+			valid &= ~hits.any(axis=1)
 
-	for zone in blue_zones:
-		zx1, zy1, zx2, zy2 = zone
-		cx = (zx1 + zx2) // 2
-		cy = (zy1 + zy2) // 2
-		dist = abs(cx - dot_px) + abs(cy - dot_pz)
-		if dist < min_dist:
-			min_dist = dist
-			best_zone = zone
+		return valid
 
-	if not best_zone:
+	def find_label_position(self, dot_px, dot_pz, display, font, log, max_range=10, min_pass=1):
+		"""
+		Returns (label_x, label_y, wrapped_lines, label_box, pass_no) for the first
+		valid candidate in pass 1-4 order, or None if every candidate is rejected.
+		min_pass=4 only tries the extended candidates, like extended_green_zone_search().
+		"""
+		metrics = get_font_metrics(font)
+		wrapped = wrap_label(display, font, max_width=200)
+		xs, ys, passes = self.build_candidates(dot_px, dot_pz, wrapped, metrics, max_range)
+		if min_pass > 1:
+			keep = passes >= min_pass
+			xs, ys, passes = xs[keep], ys[keep], passes[keep]
+
+		pad = 4
+		width = max(metrics.width(line) for line in wrapped)
+		height = len(wrapped) * metrics.line_height
+		boxes = np.stack([xs - pad, ys - pad, xs + width + pad, ys + height + pad], axis=1)
+
+		valid = self.valid_candidates(boxes)
+		if not valid.any():
+			log(f"❌ Batched placement failed for {display}")
+			return None
+
+		i = int(np.argmax(valid))
+		pass_no = int(passes[i])
+		log(f"✅ Placed using batched pass {pass_no} for {display}")
+		return int(xs[i]), int(ys[i]), wrapped, [int(v) for v in boxes[i]], pass_no
+
+### 🧩 Free-Space Placement Index: Jumps to the nearest free area that fits the label box
+class FreeSpaceIndex:
+	"""
+	Per-category placement state for --placement freespace.
+	Keeps a free-space raster built from the label mask (red and blue pixels are
+	blocked), the category's dots and every placed label. For each POI it searches
+	growing windows around the dot: a summed-area table marks every origin where the
+	whole label box is free, and a distance field from the dot picks the closest one.
+	Windows are searched on a coarse occupancy grid first and the hit is refined at
+	full resolution, so work per label is bounded whatever the local density.
+	"""
+	SEARCH_RADII = (96, 256, 640)
+	CELL = 4
+
+	def __init__(self, label_mask, red_rgb, blue_rgb, dot_centers, image_size, dot_radius=5, stroke_width=2):
+		width, height = image_size
+		if label_mask:
+			self.blocked = mask_class_raster(label_mask, red_rgb, blue_rgb) != 0
+		else:
+			self.blocked = np.zeros((height, width), dtype=bool)
+
+		# Coarse grid: a cell is blocked if any pixel inside it is
+		c = self.CELL
+		ch, cw = -(-height // c), -(-width // c)
+		padded = np.zeros((ch * c, cw * c), dtype=bool)
+		padded[:height, :width] = self.blocked
+		padded[height:, :] = True
+		padded[:, width:] = True
+		self.coarse = padded.reshape(ch, c, cw, c).any(axis=(1, 3))
+
+		buffer = dot_radius + stroke_width
+		for cx, cy in dot_centers:
+			self.block((cx - buffer, cy - buffer, cx + buffer, cy + buffer))
+
+	def block(self, box):
+		"""Marks an inclusive (x1, y1, x2, y2) box as occupied."""
+		height, width = self.blocked.shape
+		x1, y1, x2, y2 = (int(v) for v in box)
+		x1, y1 = max(x1, 0), max(y1, 0)
+		x2, y2 = min(x2, width - 1), min(y2, height - 1)
+		if x1 <= x2 and y1 <= y2:
+			self.blocked[y1:y2 + 1, x1:x2 + 1] = True
+			c = self.CELL
+			self.coarse[y1 // c:y2 // c + 1, x1 // c:x2 // c + 1] = True
+
+	def add_box(self, box):
+		"""Registers a placed label box so later labels avoid it."""
+		self.block(box)
+
+	@staticmethod
+	def _nearest_free(raster, scale, window, box_w, box_h, dot, anchor, radius=None):
+		"""
+		Searches raster[wy1:wy2, wx1:wx2] (raster units, `scale` pixels per unit) for the
+		box_w x box_h origin closest to the dot whose box is entirely free.
+		Returns the origin in pixels, or None.
+		"""
+		wx1, wy1, wx2, wy2 = window
+		if wx2 - wx1 < box_w or wy2 - wy1 < box_h:
+			return None
+
+		# Summed-area table: a box origin is free when its blocked sum is zero
+		sub = raster[wy1:wy2, wx1:wx2]
+		sat = np.zeros((sub.shape[0] + 1, sub.shape[1] + 1), dtype=np.int32)
+		np.cumsum(sub, axis=0, dtype=np.int32, out=sat[1:, 1:])
+		np.cumsum(sat[1:, 1:], axis=1, out=sat[1:, 1:])
+		covered = sat[box_h:, box_w:] - sat[:-box_h, box_w:] - sat[box_h:, :-box_w] + sat[:-box_h, :-box_w]
+		rows, cols = np.nonzero(covered == 0)
+		if not len(rows):
+			return None
+
+		# Distance field from the dot to each free box, nudged toward the classic anchor
+		dot_x, dot_y = dot
+		xs = (cols + wx1) * scale
+		ys = (rows + wy1) * scale
+		span_w, span_h = box_w * scale - 1, box_h * scale - 1
+		gap_x = np.maximum(np.maximum(xs - dot_x, dot_x - (xs + span_w)), 0)
+		gap_y = np.maximum(np.maximum(ys - dot_y, dot_y - (ys + span_h)), 0)
+		distance = (gap_x ** 2 + gap_y ** 2).astype(np.float64)
+		distance += 1e-7 * ((xs - anchor[0]) ** 2 + (ys - anchor[1]) ** 2)
+		if radius is not None:
+			distance[distance > radius ** 2] = np.inf
+
+		i = int(np.argmin(distance))
+		if not np.isfinite(distance[i]):
+			return None
+		return int(xs[i]), int(ys[i])
+
+	def find_label_position(self, dot_px, dot_pz, display, font, log, max_range=None, min_pass=1):
+		"""
+		Returns (label_x, label_y, wrapped_lines, label_box, pass_no) for the free box
+		closest to the dot, or None if nothing fits within the largest search radius.
+		Hits outside the first radius, or any hit with min_pass=4, are reported as
+		pass 4 (extended placement).
+		"""
+		pad = 4
+		c = self.CELL
+		metrics = get_font_metrics(font)
+		wrapped = wrap_label(display, font, max_width=200)
+		text_w = max(metrics.width(line) for line in wrapped)
+		text_h = len(wrapped) * metrics.line_height
+		box_w = text_w + 2 * pad + 1
+		box_h = text_h + 2 * pad + 1
+		cells_w, cells_h = -(-box_w // c), -(-box_h // c)
+		dot = (dot_px, dot_pz)
+		anchor = (dot_px + 5, dot_pz + 9)
+		height, width = self.blocked.shape
+
+		for pass_index, radius in enumerate(self.SEARCH_RADII):
+			reach_x, reach_y = (radius + box_w) // c + 1, (radius + box_h) // c + 1
+			coarse_window = (
+				max(dot_px // c - reach_x, 0), max(dot_pz // c - reach_y, 0),
+				min(dot_px // c + reach_x + 1, self.coarse.shape[1]), min(dot_pz // c + reach_y + 1, self.coarse.shape[0])
+			)
+			origin = self._nearest_free(self.coarse, c, coarse_window, cells_w, cells_h, dot, anchor, radius)
+			if origin is None:
+				continue
+
+			# Refine at full resolution around the coarse hit (which is itself free)
+			ox, oy = origin
+			fine_window = (
+				max(ox - 2 * c, 0), max(oy - 2 * c, 0),
+				min(ox + box_w + 2 * c, width), min(oy + box_h + 2 * c, height)
+			)
+			x1, y1 = self._nearest_free(self.blocked, 1, fine_window, box_w, box_h, dot, anchor) or origin
+			label_x, label_y = x1 + pad, y1 + pad
+			box = [x1, y1, label_x + text_w + pad, label_y + text_h + pad]
+			pass_no = max(1 if pass_index == 0 else 4, min_pass)
+			log(f"✅ Placed using free space within {radius}px for {display}")
+			return label_x, label_y, wrapped, box, pass_no
+
+		log(f"❌ Free-space placement failed for {display}")
 		return None
 
-	zx1, zy1, zx2, zy2 = best_zone
-	label_x = zx1 + 6  # Snap to left edge
-	label_y = zone_stack_tops.get(best_zone, zy1 + 6)
+### 🧩 Blue Zone Index: Grid-bucketed zone centers with per-zone stacking capacity
+class BlueZoneIndex:
+	"""
+	Spatial index over the blue zones from extract_blue_zones().
+	Zone centers are bucketed on a uniform grid so nearest-zone queries only visit
+	nearby cells, and each zone tracks the y where its next stacked label goes.
+	"""
+	def __init__(self, blue_zones, margin=6):
+		import heapq
+		self._heapq = heapq
+		self.zones = [tuple(zone[:4]) for zone in blue_zones]
+		self.margin = margin
+		self.stack_tops = [zy1 + margin for _, zy1, _, _ in self.zones]
+		self.centers = [((zx1 + zx2) // 2, (zy1 + zy2) // 2) for zx1, zy1, zx2, zy2 in self.zones]
+
+		self.cells = {}
+		self.cell_size = 1
+		if self.centers:
+			xs = [cx for cx, _ in self.centers]
+			ys = [cy for _, cy in self.centers]
+			extent = max(max(xs) - min(xs), max(ys) - min(ys), 1)
+			self.cell_size = max(extent // max(int(len(self.centers) ** 0.5), 1), 1)
+			for i, (cx, cy) in enumerate(self.centers):
+				self.cells.setdefault((cx // self.cell_size, cy // self.cell_size), []).append(i)
+			keys = list(self.cells)
+			self.cell_bounds = (
+				min(k[0] for k in keys), min(k[1] for k in keys),
+				max(k[0] for k in keys), max(k[1] for k in keys)
+			)
 
+	def _ring(self, qx, qy, r):
+		if r == 0:
+			yield (qx, qy)
+			return
+		for x in range(qx - r, qx + r + 1):
+			yield (x, qy - r)
+			yield (x, qy + r)
+		for y in range(qy - r + 1, qy + r):
+			yield (qx - r, y)
+			yield (qx + r, y)
+
+	def nearest(self, x, y):
+		"""
+		Yields zone indices in order of Manhattan distance from (x, y) to the zone
+		center, ties broken by extraction order, visiting grid rings outward.
+		"""
+		if not self.centers:
+			return
+		heap = []
+		size = self.cell_size
+		qx, qy = x // size, y // size
+		min_cx, min_cy, max_cx, max_cy = self.cell_bounds
+		max_r = max(abs(qx - min_cx), abs(qx - max_cx), abs(qy - min_cy), abs(qy - max_cy))
+		for r in range(max_r + 1):
+			for key in self._ring(qx, qy, r):
+				for i in self.cells.get(key, ()):
+					cx, cy = self.centers[i]
+					self._heapq.heappush(heap, (abs(cx - x) + abs(cy - y), i))
+			# Every zone in ring r + 1 or beyond is at least r * size away
+			while heap and heap[0][0] < r * size:
+				yield self._heapq.heappop(heap)[1]
+		while heap:
+			yield self._heapq.heappop(heap)[1]
+
+	def has_room(self, i, rect_coords):
+		"""True if a label box at the zone's stack top still fits inside the zone."""
+		return rect_coords[3] <= self.zones[i][3]
+
+	def push(self, i, label_y, label_height):
+		"""Advances the zone's stack top past a placed label."""
+		self.stack_tops[i] = label_y + label_height + self.margin
+
+def find_label_position_in_blue_zone(dot_px, dot_pz, display, font, zone_index, label_mask, red_rgb):
+	"""
+	Places the label at the stack top of the nearest blue zone with room left,
+	falling through to the next-nearest zone when one is full or blocked.
+	Returns (label_x, label_y, wrapped_lines, label_box) or None if no placement possible.
+	"""
+	metrics = get_font_metrics(font)
 	wrapped = wrap_label(display, font, max_width=200)
-	rect_coords = get_text_box(label_x, label_y, wrapped, font)
+	label_height = metrics.bbox("A")[3] * len(wrapped)
 
-	if is_placeable(rect_coords, label_mask, red_rgb):
-		zone_stack_tops[best_zone] = label_y + (font.getbbox("A")[3] * len(wrapped)) + 6
-		return label_x, label_y, wrapped, rect_coords
+	for i in zone_index.nearest(dot_px, dot_pz):
+		zx1, zy1, zx2, zy2 = zone_index.zones[i]
+		label_x = zx1 + 6  # Snap to left edge
+		label_y = zone_index.stack_tops[i]
+		rect_coords = get_text_box(label_x, label_y, wrapped, font)
+		if not zone_index.has_room(i, rect_coords):
+			continue
+		if is_placeable(rect_coords, label_mask, red_rgb):
+			zone_index.push(i, label_y, label_height)
+			return label_x, label_y, wrapped, rect_coords
 
 	return None
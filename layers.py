@@ -0,0 +1,106 @@
+# layers.py
+# 🧩 Layer output helpers: sparse (cropped) layer saving and the layers.json offset manifest
+
+import os
+import json
+import numpy as np
+from PIL import Image
+
+MANIFEST_NAME = "layers.json"
+
+### 🧩 Layer Saver: Writes a layer PNG, cropped to its visible pixels when --sparse is set
+def save_layer(img, path, config, offset=(0, 0)):
+	"""
+	Saves an RGBA layer whose top-left corner sits at offset on the map canvas and
+	records it in config.layer_entries. With --sparse the image is cropped to the
+	bounding box of its non-transparent pixels; fully transparent layers are not
+	written at all. Otherwise it is written as a full-canvas image.
+	Returns the manifest entry: {"offset": [x, y] or None, "size": [w, h]}.
+	"""
+	if getattr(config.args, "sparse", False):
+		bbox = img.getchannel("A").getbbox()
+		if bbox is None:
+			entry = {"offset": None, "size": [0, 0]}
+		else:
+			img = img.crop(bbox)
+			entry = {"offset": [offset[0] + bbox[0], offset[1] + bbox[1]], "size": list(img.size)}
+	else:
+		if tuple(offset) != (0, 0) or img.size != tuple(config.image_size):
+			canvas = Image.new("RGBA", config.image_size, (255, 255, 255, 0))
+			canvas.paste(img, tuple(offset))
+			img = canvas
+		entry = {"offset": [0, 0], "size": list(img.size)}
+
+	if entry["offset"] is not None:
+		palette_mode = getattr(config.args, "palette_layers", None)
+		if palette_mode:
+			img = palettize(img, lossy=palette_mode == "quantize")
+		config.image_writer.save(img, path, "layer")
+	key = os.path.relpath(path, config.output_dir).replace(os.sep, "/")
+	config.layer_entries[key] = entry
+	return entry
+
+### 🧩 Palette Layers: Stores an RGBA layer as a P image with an RGBA palette
+def palettize(img, lossy=False):
+	"""
+	Returns img as a palette image when it has at most 256 distinct RGBA colors
+	(exact: every pixel maps to its own palette entry). Busier layers, such as labels
+	with anti-aliased text over translucent boxes, are returned unchanged, or with
+	lossy=True reduced to 256 colors by Pillow's fast octree quantizer.
+	"""
+	if img.mode != "RGBA":
+		return img
+	colors = img.getcolors(256)
+	if colors is None:
+		return img.quantize(256, method=Image.Quantize.FASTOCTREE) if lossy else img
+
+	# Pack each RGBA pixel into one uint32 and look it up in the sorted palette
+	palette = np.sort(np.array([color for _, color in colors], dtype=np.uint8).view("<u4").ravel())
+	pixels = np.asarray(img).view("<u4")[..., 0]
+	indices = np.searchsorted(palette, pixels).astype(np.uint8)
+	paletted = Image.fromarray(indices, "P")
+	paletted.putpalette(palette.view(np.uint8).tobytes(), "RGBA")
+	return paletted
+
+### 🧩 Manifest Writer: Records every layer's offset on the full map canvas
+def write_layer_manifest(output_dir, canvas_size, entries):
+	manifest = {
+		"canvas_size": list(canvas_size),
+		"layers": dict(sorted(entries.items()))
+	}
+	path = os.path.join(output_dir, MANIFEST_NAME)
+	with open(path, "w", encoding="utf-8") as f:
+		json.dump(manifest, f, indent=2)
+	return path
+
+def load_layer_manifest(output_dir):
+	"""Returns the parsed layers.json for an output folder, or None if it has none."""
+	path = os.path.join(output_dir, MANIFEST_NAME)
+	if not os.path.exists(path):
+		return None
+	with open(path, encoding="utf-8") as f:
+		return json.load(f)
+
+### 🧩 Layer Reader: Opens a layer and its canvas offset, honoring the manifest
+def open_layer(path, output_dir=None, manifest=None):
+	"""
+	Returns (image, (x, y)) for a layer file, or (None, None) if the manifest marks
+	it as empty. Files not listed in a manifest are treated as full canvases at (0, 0).
+	"""
+	output_dir = output_dir or os.path.dirname(path)
+	if manifest is None:
+		manifest = load_layer_manifest(output_dir) or {"layers": {}}
+	key = os.path.relpath(path, output_dir).replace(os.sep, "/")
+	entry = manifest["layers"].get(key)
+	if entry is not None and entry["offset"] is None:
+		return None, None
+	offset = tuple(entry["offset"]) if entry else (0, 0)
+	return Image.open(path), offset
+
+def expand_layer(path, canvas_size, output_dir=None, manifest=None):
+	"""Opens a layer as a full-canvas RGBA image, pasting sparse crops at their offset."""
+	img, offset = open_layer(path, output_dir, manifest)
+	canvas = Image.new("RGBA", tuple(canvas_size), (255, 255, 255, 0))
+	if img is not None:
+		canvas.paste(img.convert("RGBA"), offset)
+	return canvas
@@ -1,14 +1,17 @@
 # main.py
 
-from helper import Config, get_args
-args = get_args()
-from parse import load_display_names, load_tiers, load_biome_image, extract_blue_zones
+from helper import Config, get_args, plan_memory_budget
+from parse import load_display_names, load_tiers, load_biome_image, load_blue_zones
 from filters import should_exclude
-from render import render_category_layer
-from labeler import (is_placeable, placed_bounding_boxes)
+from render import render_category_result, init_category_worker, render_category_job
+from layers import write_layer_manifest
+from render_cache import LayerCache, file_digest
+from placement import save_placement_plan
+from compositor import LayerCompositor, StripCompositor
 import os
 import xml.etree.ElementTree as ET
-from collections import defaultdict
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image
 import time
 import datetime
@@ -23,7 +26,7 @@ LABEL_MASK_BLUE = (0, 42, 118)
 def null_log(msg):
 	pass
 
-def create_logger(verbose):
+def create_logger(verbose, config, version):
 	if verbose:
 		os.makedirs(config.output_dir, exist_ok=True)
 		log_file = open(os.path.join(config.log_dir, "green_zone_debug.txt"), "w")
@@ -34,88 +37,6 @@ def create_logger(verbose):
 		return log, log_file
 	return null_log, None
 
-# === Setup ===
-config = Config(args)
-start_time = time.time()
-# Load version string from version.txt
-try:
-	with open("version.txt") as vf:
-		version = vf.read().strip()
-except FileNotFoundError:
-	version = "unknown"
-
-# === Build dynamic output folder name based on CLI flags ===
-flag_parts = []
-
-if args.numbered_dots:
-	flag_parts.append("--numbered-dots")
-if args.mask:
-	flag_parts.append("--mask")
-if args.with_player_starts:
-	flag_parts.append("--with-player-starts")
-if args.combined:
-	flag_parts.append("--combined")
-if args.skip_layers:
-	flag_parts.append("--skip-layers")
-if args.verbose:
-	flag_parts.append("--verbose")
-if args.log_missing:
-	flag_parts.append("--log-missing")
-if args.only_biomes:
-	flag_parts.append("--only-biomes")
-
-from parse import load_prefab_metadata
-prefab_info = load_prefab_metadata(config.prefab_dir)
-
-timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H%M")
-suffix = f"{''.join(flag_parts)}__{timestamp}" if flag_parts else timestamp
-
-config.output_dir = f"output--{version}--{suffix}"
-config.combined_dir = os.path.join(config.output_dir, "combined")
-os.makedirs(config.output_dir, exist_ok=True)
-
-if config.args.combined:
-	os.makedirs(config.combined_dir, exist_ok=True)
-
-if args.verbose or args.log_missing:
-	config.log_dir = os.path.join(config.output_dir, "logs")
-	os.makedirs(config.log_dir, exist_ok=True)
-else:
-	config.log_dir = None  # Prevent accidental use
-
-if config.log_dir:
-	config.verbose_log = os.path.join(config.log_dir, "verbose_log.csv")
-	config.verbose_log_file = open(config.verbose_log, "w", encoding="utf-8")
-	config.verbose_log_file.write(f"# prefab2png version: {version}\n")
-	config.missing_log = os.path.join(config.log_dir, "missing_display_names.txt")
-	config.excluded_log = os.path.join(config.log_dir, "excluded_prefabs.txt")
-else:
-	config.verbose_log = None
-	config.verbose_log_file = None
-	config.missing_log = None
-	config.excluded_log = None
-
-display_names = load_display_names(config.localization_path)
-tier_colors = load_tiers()
-biome_img = load_biome_image(config.biome_path, config.image_size)
-
-# === Label Mask ===
-label_mask = None
-blue_zones = []
-
-if args.mask:
-	if os.path.exists(LABEL_MASK_PATH):
-		label_mask = Image.open(LABEL_MASK_PATH).convert("RGB")
-		blue_zones = extract_blue_zones(label_mask, LABEL_MASK_BLUE)
-		print(f"✅ Loaded label mask with {len(blue_zones)} blue zones.")
-	else:
-		print(f"⚠️ Label mask not found: {LABEL_MASK_PATH}")
-else:
-	print("✅ Defaulting to green zone logic: label mask not used unless --mask is set.")
-
-# === Logger Setup ===
-log, log_file = create_logger(args.verbose)
-
 # === Parse prefabs.xml ===
 ### 🧩 Prefab Placement Parser: Uses prefab metadata for accurate center shift and difficulty tier
 def parse_prefabs(xml_path, biome_img, config, prefab_info, display_names):
@@ -180,19 +101,10 @@ def parse_prefabs(xml_path, biome_img, config, prefab_info, display_names):
 
 	return categorized_points, excluded_names, missing_names, tiers
 
-categorized_points, excluded_names, missing_names, prefab_tiers = parse_prefabs(
-	config.xml_path, biome_img, config, prefab_info, display_names
-)
-
 # === Render ===
-layer_files = []
-legend_entries = []
-if args.skip_layers:
-	if args.skip_layers:
-		legend_entries["P0000"] = ("DEBUG TEST POI", "debug_test_poi")
-
-if not args.skip_layers:
-	combined_path = None
+### 🧩 Category Selector: Applies --only-biomes and --with-player-starts to the parsed categories
+def select_categories(categorized_points, args):
+	selected = []
 	for category, points in categorized_points.items():
 		# Only render biome_* categories listed
 		if args.only_biomes:
@@ -204,29 +116,87 @@ if not args.skip_layers:
 		# ✅ Skip player_starts unless explicitly enabled
 		if category == "player_starts" and not args.with_player_starts:
 			continue
-
-		dot_centers = [(px, pz) for _, _, px, pz in points]
-
-		combined_path, rejections = render_category_layer(
-			category=category,
-			points=points,
-			config=config,
-			display_names=display_names,
-			tiers=prefab_tiers,
-			tier_colors=tier_colors,
-			legend_entries=legend_entries,
-			label_mask=label_mask,
-			blue_zones=blue_zones,
-			red_rgb=LABEL_MASK_RED,
-			blue_rgb=LABEL_MASK_BLUE,
-			log=log,
-			numbered_dots=args.numbered_dots
-		)
-		if combined_path:
-			layer_files.append(combined_path)
+		selected.append((category, points))
+	return selected
+
+### 🧩 Layer Renderer: Renders each category in order, or across --jobs worker processes
+def render_layers(categories, config, display_names, tiers, tier_colors, label_mask, blue_zones, log, compositor=None, cache=None):
+	"""
+	Returns (layer_files, legend_entries) merged in category order.
+	With a compositor, each finished combined layer is blended into it in category order.
+	With a LayerCache, categories whose inputs match an entry are restored instead of
+	re-rendered and the rest are staged; call cache.commit() after the final flush.
+	"""
+	layer_files = []
+	legend_entries = []
+	jobs = max(1, config.args.jobs or 1)
+
+	keys = [None] * len(categories)
+	cached = [None] * len(categories)
+	if cache is not None:
+		for i, (category, points) in enumerate(categories):
+			keys[i] = cache.key(category, points, display_names, tiers, tier_colors)
+			cached[i] = cache.load(keys[i], config)
+		if cache.hits:
+			print(f"♻️ Reusing {cache.hits} unchanged layer(s) from the cache; rendering {cache.misses}.")
+	pending = [i for i in range(len(categories)) if cached[i] is None]
+
+	def merge(i, result):
+		for line in result["log_lines"]:
+			log(line)
+		if config.verbose_log_file and result["verbose_rows"]:
+			config.verbose_log_file.write(result["verbose_rows"])
+		legend_entries.extend(result["legend_entries"])
+		config.layer_entries.update(result["layer_entries"])
+		if compositor is not None:
+			for layer, offset in result["composite_layers"]:
+				compositor.add(layer, offset)
+		save_placement_plan(config.output_dir, result["plan"])
+		if result["combined_path"]:
+			layer_files.append(result["combined_path"])
+		if cache is not None and not result.get("cached"):
+			cache.stage(keys[i], result, config)
+
+	if jobs == 1 or len(pending) < 2:
+		for i, (category, points) in enumerate(categories):
+			result = cached[i] or render_category_result(
+				config,
+				category,
+				points,
+				display_names,
+				tiers,
+				tier_colors,
+				label_mask,
+				blue_zones,
+				LABEL_MASK_RED,
+				LABEL_MASK_BLUE
+			)
+			merge(i, result)
+		return layer_files, legend_entries
+
+	print(f"🧵 Rendering {len(pending)} layers across {jobs} worker processes...")
+	mask_path = LABEL_MASK_PATH if label_mask is not None else None
+	names = {name for i in pending for _, name, _, _ in categories[i][1]}
+	worker_args = (
+		config.args,
+		config.output_dir,
+		config.combined_dir,
+		mask_path,
+		LABEL_MASK_RED,
+		LABEL_MASK_BLUE,
+		{name: display_names[name] for name in names if name in display_names},
+		{name: tiers[name] for name in names if name in tiers},
+		tier_colors
+	)
+	with ProcessPoolExecutor(max_workers=jobs, initializer=init_category_worker, initargs=worker_args) as pool:
+		futures = {i: pool.submit(render_category_job, *categories[i]) for i in pending}
+		for i in range(len(categories)):
+			merge(i, cached[i] or futures[i].result())
+
+	return layer_files, legend_entries
 
 # === Render Legend ===
-def render_legend(legend_entries, config):
+def render_legend(legend_entries, config, prefab_tiers, tier_colors):
 	from PIL import ImageDraw
 
 	print("🗺️ Rendering POI legend with full left zone + right overflow...")
@@ -243,11 +213,11 @@ def render_legend(legend_entries, config):
 	# Zone boundaries
 	COL_WIDTH = 400	 # max label width, adjustable
 	COL_SPACING = 20
-	
+
 	# Left zone: 2 columns
 	LEFT_START_X = 20
 	LEFT_MAX_X = LEFT_START_X + COL_WIDTH * 2 + COL_SPACING
-	
+
 	# Right zone: 2 columns
 	RIGHT_START_X = config.image_size[0] - COL_WIDTH * 2 - COL_SPACING
 	RIGHT_MAX_X = config.image_size[0] - 20
@@ -293,14 +263,14 @@ def render_legend(legend_entries, config):
 		text_h = bbox[3] - bbox[1]
 		pad = 6
 		box = [x - pad, y - pad, x + text_w + pad, y + text_h + pad]
-				
+
 		# Draw text on top
 		draw.text((x, y), text, fill=dot_color, font=font)
 		drawn_boxes.append((box[0], box[1], box[2], box[3]))
 		drawn_entries.append((text, tuple(box), dot_color, (x, y)))
 		y += line_height
 		entries_drawn += 1
-	   
+
 	# Draw background and title box
 	if drawn_boxes:
 		pad = 8
@@ -319,41 +289,213 @@ def render_legend(legend_entries, config):
 
 	print(f"✅ Legend rendered: {entries_drawn} entries")
 	legend_path = os.path.join(config.output_dir, "poi_legend.png")
-	img.save(legend_path)
+	config.image_writer.save(img, legend_path, "final")
 	print(f"✅ Legend saved to: {legend_path}")
 
-if legend_entries:
-	render_legend(legend_entries, config)
-
-# === Combine All Layers ===
-if args.combined and layer_files:
-	print("🧩 Combining all layers...")
-	final = Image.new("RGBA", config.image_size, (255, 255, 255, 0))
-	for path in layer_files:
-		layer = Image.open(path)
-		final = Image.alpha_composite(final, layer)
-
-	final_path = os.path.join(config.combined_dir, "map_all_layers_combined.png")
-	final.save(final_path)
-	print(f"✅ Final map saved: {final_path}")
-
-# === Final Logs ===
-if args.log_missing and missing_names:
-	with open(config.missing_log, "w", encoding="utf-8") as f:
-		for name in sorted(missing_names):
-			f.write(f"{name}\n")
-	print(f"📝 Missing display names: {config.missing_log}")
-else:
-	print("ℹ️  No missing display names to log.")
-
-if args.verbose and excluded_names:
-	with open(config.excluded_log, "w", encoding="utf-8") as f:
-		f.write(f"# prefab2png version: {version}\n")
-		for cat, names in excluded_names.items():
-			for name in sorted(names):
-				f.write(f"{cat},{name}\n")
-	print(f"📝 Excluded prefab names: {config.excluded_log}")
-
-if config.verbose_log_file:
-	config.verbose_log_file.close()
-print(f"🕒 Render completed in {time.time() - start_time:.2f} seconds")	   
\ No newline at end of file
+def load_version():
+	try:
+		with open("version.txt") as vf:
+			return vf.read().strip()
+	except FileNotFoundError:
+		return "unknown"
+
+### 🧩 Output Folder Suffix: Encodes the main CLI flags and a timestamp in the folder name
+def output_suffix(args):
+	flag_parts = []
+
+	if args.numbered_dots:
+		flag_parts.append("--numbered-dots")
+	if args.mask:
+		flag_parts.append("--mask")
+	if args.with_player_starts:
+		flag_parts.append("--with-player-starts")
+	if args.combined:
+		flag_parts.append("--combined")
+	if args.skip_layers:
+		flag_parts.append("--skip-layers")
+	if args.verbose:
+		flag_parts.append("--verbose")
+	if args.log_missing:
+		flag_parts.append("--log-missing")
+	if args.only_biomes:
+		flag_parts.append("--only-biomes")
+
+	timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H%M")
+	return f"{''.join(flag_parts)}__{timestamp}" if flag_parts else timestamp
+
+### 🧩 Shared Inputs: Everything that stays the same between worlds, loaded once
+SharedInputs = namedtuple("SharedInputs", ["prefab_info", "display_names", "tier_colors", "font", "label_mask", "blue_zones"])
+
+def load_shared_inputs(config, args):
+	"""Loads localization, prefab metadata, tier colors, the font and the label mask."""
+	from parse import load_prefab_metadata
+	prefab_info = load_prefab_metadata(config.prefab_dir)
+	display_names = load_display_names(config.localization_path)
+	tier_colors = load_tiers()
+
+	label_mask = None
+	blue_zones = []
+	if args.mask:
+		if os.path.exists(LABEL_MASK_PATH):
+			label_mask = Image.open(LABEL_MASK_PATH).convert("RGB")
+			blue_zones = load_blue_zones(LABEL_MASK_PATH, label_mask, LABEL_MASK_BLUE)
+			print(f"✅ Loaded label mask with {len(blue_zones)} blue zones.")
+		else:
+			print(f"⚠️ Label mask not found: {LABEL_MASK_PATH}")
+	else:
+		print("✅ Defaulting to green zone logic: label mask not used unless --mask is set.")
+
+	return SharedInputs(prefab_info, display_names, tier_colors, config.font, label_mask, blue_zones)
+
+### 🧩 World Renderer: Renders one world's layers, legend and combined map into config.output_dir
+def render_world(config, shared, version):
+	"""
+	Renders the world described by config (prefabs.xml, biomes.png, world size)
+	using the already loaded shared inputs. Returns a dict of run statistics.
+	"""
+	args = config.args
+	world_start = time.time()
+	config.font = shared.font
+	config.combined_dir = os.path.join(config.output_dir, "combined")
+	os.makedirs(config.output_dir, exist_ok=True)
+
+	if config.args.combined:
+		os.makedirs(config.combined_dir, exist_ok=True)
+
+	if args.verbose or args.log_missing:
+		config.log_dir = os.path.join(config.output_dir, "logs")
+		os.makedirs(config.log_dir, exist_ok=True)
+	else:
+		config.log_dir = None  # Prevent accidental use
+
+	if config.log_dir:
+		config.verbose_log = os.path.join(config.log_dir, "verbose_log.csv")
+		config.verbose_log_file = open(config.verbose_log, "w", encoding="utf-8")
+		config.verbose_log_file.write(f"# prefab2png version: {version}\n")
+		config.missing_log = os.path.join(config.log_dir, "missing_display_names.txt")
+		config.excluded_log = os.path.join(config.log_dir, "excluded_prefabs.txt")
+	else:
+		config.verbose_log = None
+		config.verbose_log_file = None
+		config.missing_log = None
+		config.excluded_log = None
+
+	display_names = shared.display_names
+	tier_colors = shared.tier_colors
+	biome_img = load_biome_image(config.biome_path, config.image_size)
+
+	# === Label Mask ===
+	label_mask = shared.label_mask
+	blue_zones = shared.blue_zones
+	if label_mask is not None and label_mask.size != config.image_size:
+		print(f"⚠️ Label mask is {label_mask.size[0]}x{label_mask.size[1]} but the canvas is {config.image_size[0]}x{config.image_size[1]}; ignoring --mask.")
+		label_mask = None
+		blue_zones = []
+	config.mask_digest = file_digest(LABEL_MASK_PATH) if label_mask is not None else None
+
+	# === Logger Setup ===
+	log, log_file = create_logger(args.verbose, config, version)
+
+	categorized_points, excluded_names, missing_names, prefab_tiers = parse_prefabs(
+		config.xml_path, biome_img, config, shared.prefab_info, display_names
+	)
+
+	# === Render ===
+	layer_files = []
+	legend_entries = []
+	if args.skip_layers:
+		if args.skip_layers:
+			legend_entries["P0000"] = ("DEBUG TEST POI", "debug_test_poi")
+
+	compositor = None
+	if args.combined:
+		if args.strip_height:
+			compositor = StripCompositor(config.image_size, args.strip_height)
+		else:
+			compositor = LayerCompositor(config.image_size)
+	categories = select_categories(categorized_points, args)
+	layer_cache = None
+	if config.cache_dir and not args.skip_layers:
+		mask_path = LABEL_MASK_PATH if label_mask is not None else None
+		layer_cache = LayerCache(config.cache_dir, config, mask_path, args.cache_max_mb)
+	if not args.skip_layers:
+		layer_files, legend_entries = render_layers(
+			categories,
+			config,
+			display_names,
+			prefab_tiers,
+			tier_colors,
+			label_mask,
+			blue_zones,
+			log,
+			compositor,
+			layer_cache
+		)
+
+	if config.layer_entries:
+		write_layer_manifest(config.output_dir, config.image_size, config.layer_entries)
+
+	if legend_entries:
+		render_legend(legend_entries, config, prefab_tiers, tier_colors)
+
+	# === Combine All Layers ===
+	if compositor is not None and compositor.layers_added:
+		print("🧩 Combining all layers...")
+		final_path = os.path.join(config.combined_dir, "map_all_layers_combined.png")
+		compositor.save(final_path, config.image_writer)
+		print(f"✅ Final map saved: {final_path}")
+
+	# === Final Logs ===
+	if args.log_missing and missing_names:
+		with open(config.missing_log, "w", encoding="utf-8") as f:
+			for name in sorted(missing_names):
+				f.write(f"{name}\n")
+		print(f"📝 Missing display names: {config.missing_log}")
+	else:
+		print("ℹ️  No missing display names to log.")
+
+	if args.verbose and excluded_names:
+		with open(config.excluded_log, "w", encoding="utf-8") as f:
+			f.write(f"# prefab2png version: {version}\n")
+			for cat, names in excluded_names.items():
+				for name in sorted(names):
+					f.write(f"{cat},{name}\n")
+		print(f"📝 Excluded prefab names: {config.excluded_log}")
+
+	config.image_writer.flush()
+	if layer_cache is not None:
+		layer_cache.commit(config)
+	if config.verbose_log_file:
+		config.verbose_log_file.close()
+	if log_file:
+		log_file.close()
+
+	return {
+		"output_dir": config.output_dir,
+		"world_size": config.world_size,
+		"pois": sum(len(points) for _, points in categories),
+		"categories": len(categories),
+		"legend_entries": len(legend_entries),
+		"seconds": time.time() - world_start,
+	}
+
+def main():
+	args = get_args()
+
+	# === Setup ===
+	config = Config(args)
+	start_time = time.time()
+	print(f"🌍 World size: {config.world_size} (from {config.world_size_source}), canvas {config.image_size[0]}x{config.image_size[1]}")
+	args.world_size = config.world_size  # Workers rebuild Config from args; skip re-detection there
+	plan_memory_budget(args, config.image_size)
+	version = load_version()
+	config.output_dir = f"output--{version}--{output_suffix(args)}"
+
+	shared = load_shared_inputs(config, args)
+	render_world(config, shared, version)
+
+	config.image_writer.close()
+	print(f"🕒 Render completed in {time.time() - start_time:.2f} seconds")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,175 @@
+# make_tiles.py
+# 🧩 Tile pyramid export: cuts rendered map layers into XYZ web tiles at every zoom level
+
+import os
+import json
+import math
+import time
+import argparse
+from datetime import datetime
+from functools import partial
+from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+from layers import MANIFEST_NAME, load_layer_manifest, open_layer
+
+TILES_MANIFEST_NAME = "tiles.json"
+
+### 🧩 Layer Source: Opens a layer and its canvas offset, honoring a sparse layers.json if one covers it
+def load_source(path):
+	"""
+	Returns (image, offset, canvas_size). Layers listed in a layers.json (in their own
+	folder or one level up, e.g. combined/) keep their sparse crop and offset;
+	any other image is treated as a full canvas at (0, 0).
+	"""
+	folder = os.path.dirname(os.path.abspath(path))
+	for output_dir in (folder, os.path.dirname(folder)):
+		if not os.path.exists(os.path.join(output_dir, MANIFEST_NAME)):
+			continue
+		manifest = load_layer_manifest(output_dir)
+		key = os.path.relpath(os.path.abspath(path), output_dir).replace(os.sep, "/")
+		if key in manifest["layers"]:
+			img, offset = open_layer(path, output_dir, manifest)
+			if img is not None:
+				img = img.convert("RGBA")
+			return img, offset, tuple(manifest["canvas_size"])
+
+	img = Image.open(path).convert("RGBA")
+	return img, (0, 0), img.size
+
+def max_zoom_for(canvas_size, tile_size):
+	"""Lowest zoom level at which one tile pixel is one map pixel."""
+	return max(0, math.ceil(math.log2(max(canvas_size) / tile_size)))
+
+def tile_path(layer_dir, zoom, x, y):
+	return os.path.join(layer_dir, str(zoom), str(x), f"{y}.png")
+
+### 🧩 Base Level Cutter: Crops one row of full-resolution tiles, skipping fully transparent ones
+def cut_base_row(img, offset, canvas_size, tile_size, ty):
+	"""Returns [((x, y), tile)] for the non-empty tiles in row ty of the full-resolution level."""
+	ox, oy = offset
+	columns = math.ceil(canvas_size[0] / tile_size)
+	top = ty * tile_size - oy
+	tiles = []
+	if top >= img.height or top + tile_size <= 0:
+		return tiles
+	for tx in range(columns):
+		left = tx * tile_size - ox
+		if left >= img.width or left + tile_size <= 0:
+			continue
+		tile = img.crop((left, top, left + tile_size, top + tile_size))
+		if tile.getchannel("A").getbbox() is None:
+			continue
+		tiles.append(((tx, ty), tile))
+	return tiles
+
+### 🧩 Parent Level Builder: Merges 2x2 child tiles and downsamples them into one parent tile
+def build_parent_row(children, tile_size, py):
+	"""
+	Returns [((x, y), tile)] for row py of the next zoom level out, built from the
+	already cut children rather than from the source. Downsampling is done on
+	premultiplied alpha so transparent edges don't darken.
+	"""
+	groups = {}
+	for cy in (2 * py, 2 * py + 1):
+		for cx, tile in children.get(cy, {}).items():
+			groups.setdefault(cx // 2, []).append(((cx % 2) * tile_size, (cy % 2) * tile_size, tile))
+
+	parents = []
+	for px in sorted(groups):
+		merged = Image.new("RGBa", (tile_size * 2, tile_size * 2))
+		for x, y, tile in groups[px]:
+			merged.paste(tile.convert("RGBa"), (x, y))
+		parent = merged.reduce(2).convert("RGBA")
+		if parent.getchannel("A").getbbox() is None:
+			continue
+		parents.append(((px, py), parent))
+	return parents
+
+### 🧩 Pyramid Writer: Writes every zoom level of one layer and returns its tile counts
+def write_pyramid(name, path, out_dir, tile_size, pool, compression=6, min_zoom=0):
+	"""
+	Cuts, merges and encodes tiles on the thread pool, one task per row of tiles
+	(crop or 2x2 merge plus PNG save). Each level is finished before the next one
+	out is built from it.
+	"""
+	img, offset, canvas_size = load_source(path)
+	max_zoom = max_zoom_for(canvas_size, tile_size)
+	layer_dir = os.path.join(out_dir, name)
+	counts = {}
+
+	def save_row(zoom, tiles):
+		for (x, y), tile in tiles:
+			tile_file = tile_path(layer_dir, zoom, x, y)
+			os.makedirs(os.path.dirname(tile_file), exist_ok=True)
+			tile.save(tile_file, compress_level=compression)
+		return tiles
+
+	def base_row(ty):
+		return save_row(max_zoom, cut_base_row(img, offset, canvas_size, tile_size, ty))
+
+	def parent_row(zoom, children, py):
+		return save_row(zoom, build_parent_row(children, tile_size, py))
+
+	# Tiles of the level just written, by row then column
+	level = {}
+	for zoom in range(max_zoom, min_zoom - 1, -1):
+		if zoom == max_zoom:
+			rows = [] if img is None else range(math.ceil(canvas_size[1] / tile_size))
+			results = pool.map(base_row, rows)
+		else:
+			results = pool.map(partial(parent_row, zoom, level), sorted({y // 2 for y in level}))
+		level = {}
+		for tiles in results:
+			for (x, y), tile in tiles:
+				level.setdefault(y, {})[x] = tile
+		counts[zoom] = sum(len(row) for row in level.values())
+		print(f"🧱 {name}: zoom {zoom} → {counts[zoom]} tiles")
+
+	return {
+		"path": f"{name}/{{z}}/{{x}}/{{y}}.png",
+		"canvas_size": list(canvas_size),
+		"min_zoom": min_zoom,
+		"max_zoom": max_zoom,
+		"tiles": {str(zoom): counts[zoom] for zoom in sorted(counts)},
+	}
+
+def parse_layer_arg(value):
+	name, sep, path = value.partition("=")
+	if not sep or not name or not path:
+		raise argparse.ArgumentTypeError(f"Expected NAME=PATH, got: {value}")
+	if not os.path.isfile(path):
+		raise argparse.ArgumentTypeError(f"Layer file not found: {path}")
+	return name, path
+
+def main():
+	start_time = time.perf_counter()
+	parser = argparse.ArgumentParser(description="Export rendered map layers as an XYZ tile pyramid for web viewers")
+	parser.add_argument("--layer", action="append", type=parse_layer_arg, required=True, metavar="NAME=PATH",
+		help="Layer to tile, e.g. terrain=terrain_biome_shaded_final.png. Repeat for stickers, POIs, etc.")
+	parser.add_argument("--out", help="Output folder (default: tiles__<timestamp>)")
+	parser.add_argument("--tile-size", type=int, default=256, help="Tile edge in pixels (default: 256)")
+	parser.add_argument("--min-zoom", type=int, default=0, help="Lowest zoom level to write (default: 0)")
+	parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Tile cutting and encoding threads (default: CPU count)")
+	parser.add_argument("--compression", type=int, choices=range(0, 10), default=6, metavar="0-9", help="PNG zlib level for tiles (default: 6)")
+	args = parser.parse_args()
+
+	out_dir = args.out or f"tiles__{datetime.now().strftime('%Y-%m-%d_%H%M')}"
+	os.makedirs(out_dir, exist_ok=True)
+	print(f"📁 Output directory: {out_dir}")
+
+	tilesets = {}
+	with ThreadPoolExecutor(max_workers=max(1, args.jobs), thread_name_prefix="tiles") as pool:
+		for name, path in args.layer:
+			print(f"🗺️ Tiling {name}: {path}")
+			tilesets[name] = write_pyramid(name, path, out_dir, args.tile_size, pool, args.compression, args.min_zoom)
+
+	manifest_path = os.path.join(out_dir, TILES_MANIFEST_NAME)
+	with open(manifest_path, "w", encoding="utf-8") as f:
+		json.dump({"tile_size": args.tile_size, "scheme": "xyz", "layers": tilesets}, f, indent=2)
+	print(f"✅ Tile manifest saved: {manifest_path}")
+
+	duration = time.perf_counter() - start_time
+	print(f"\n⏱️ Total tiling time: {duration:.2f} seconds")
+
+if __name__ == "__main__":
+	main()
@@ -5,7 +5,7 @@ import csv
 import math
 import xml.etree.ElementTree as ET
 from PIL import Image, ImageFont, ImageColor, ImageDraw
-from collections import defaultdict, namedtuple, deque
+from collections import defaultdict, namedtuple
 
 
 # === DISPLAY NAME MAPPING ===
@@ -64,37 +64,109 @@ def load_biome_image(path, target_size):
 	return None
 
 # === LABEL MASK ===
+BlueZone = namedtuple("BlueZone", ["x1", "y1", "x2", "y2", "area"])
+
+### 🧩 Blue Zone Extractor: Labels 4-connected blue regions from row runs instead of a per-pixel flood fill
 def extract_blue_zones(mask_img, blue_rgb=(0, 42, 118)):
-	width, height = mask_img.size
-	pixels = mask_img.load()
-	visited = [[False] * height for _ in range(width)]
-	blue_zones = []
-
-	def flood_fill(x, y):
-		q = deque([(x, y)])
-		min_x = max_x = x
-		min_y = max_y = y
-		visited[x][y] = True
-
-		while q:
-			cx, cy = q.popleft()
-			for dx, dy in [(-1,0), (1,0), (0,-1), (0,1)]:
-				nx, ny = cx + dx, cy + dy
-				if 0 <= nx < width and 0 <= ny < height:
-					if not visited[nx][ny] and pixels[nx, ny] == blue_rgb:
-						visited[nx][ny] = True
-						q.append((nx, ny))
-						min_x = min(min_x, nx)
-						max_x = max(max_x, nx)
-						min_y = min(min_y, ny)
-						max_y = max(max_y, ny)
-		return (min_x, min_y, max_x, max_y)
-
-	for x in range(width):
-		for y in range(height):
-			if not visited[x][y] and pixels[x, y] == blue_rgb:
-				blue_zones.append(flood_fill(x, y))
+	"""
+	Finds every 4-connected region of blue_rgb pixels in the label mask.
+	Returns a list of BlueZone(x1, y1, x2, y2, area), ordered as the original
+	column-major flood fill discovered them.
+	"""
+	import numpy as np
+
+	rgb = np.asarray(mask_img.convert("RGB"))
+	blue = np.all(rgb == np.array(blue_rgb, dtype=rgb.dtype), axis=-1)
+	height, width = blue.shape
+
+	# Horizontal runs of blue pixels: [start, end) per row
+	padded = np.zeros((height, width + 2), dtype=np.int8)
+	padded[:, 1:-1] = blue
+	edges = np.diff(padded, axis=1)
+	run_rows, run_starts = np.nonzero(edges == 1)
+	_, run_ends = np.nonzero(edges == -1)
+	if not len(run_rows):
+		return []
+
+	# Union runs that overlap a run in the row above (4-connectivity)
+	parent = list(range(len(run_rows)))
+
+	def find(i):
+		while parent[i] != i:
+			parent[i] = parent[parent[i]]
+			i = parent[i]
+		return i
+
+	row_bounds = np.searchsorted(run_rows, np.arange(height + 1))
+	for y in range(1, height):
+		lo, hi = row_bounds[y], row_bounds[y + 1]
+		plo, phi = row_bounds[y - 1], row_bounds[y]
+		if lo == hi or plo == phi:
+			continue
+		prev_starts = run_starts[plo:phi]
+		prev_ends = run_ends[plo:phi]
+		first = np.searchsorted(prev_ends, run_starts[lo:hi], side="right")
+		last = np.searchsorted(prev_starts, run_ends[lo:hi], side="left")
+		for i, (a, b) in enumerate(zip(first, last)):
+			for j in range(a, b):
+				ra, rb = find(lo + i), find(plo + j)
+				if ra != rb:
+					parent[max(ra, rb)] = min(ra, rb)
+
+	labels = np.array([find(i) for i in range(len(parent))])
+	roots, labels = np.unique(labels, return_inverse=True)
+	count = len(roots)
+
+	min_x = np.full(count, width)
+	max_x = np.full(count, -1)
+	min_y = np.full(count, height)
+	max_y = np.full(count, -1)
+	np.minimum.at(min_x, labels, run_starts)
+	np.maximum.at(max_x, labels, run_ends - 1)
+	np.minimum.at(min_y, labels, run_rows)
+	np.maximum.at(max_y, labels, run_rows)
+	area = np.bincount(labels, weights=run_ends - run_starts, minlength=count).astype(int)
+
+	# Discovery order of the column-major scan: leftmost column, then topmost pixel in it
+	first_y = np.full(count, height)
+	at_left = run_starts == min_x[labels]
+	np.minimum.at(first_y, labels[at_left], run_rows[at_left])
+	order = np.lexsort((first_y, min_x))
+
+	return [
+		BlueZone(int(min_x[i]), int(min_y[i]), int(max_x[i]), int(max_y[i]), int(area[i]))
+		for i in order
+	]
+
+### 🧩 Cached Blue Zones: Reuses zones stored next to the mask while its content hash is unchanged
+def load_blue_zones(mask_path, mask_img, blue_rgb=(0, 42, 118)):
+	"""
+	Returns blue zones for mask_path, reading them from <mask_path>.blue_zones.json
+	when the cached hash matches, otherwise extracting and rewriting the cache.
+	"""
+	import hashlib
+	import json
+
+	with open(mask_path, "rb") as f:
+		mask_hash = hashlib.sha256(f.read()).hexdigest()
+	cache_path = f"{mask_path}.blue_zones.json"
+	blue_key = list(blue_rgb)
+
+	if os.path.exists(cache_path):
+		try:
+			with open(cache_path, encoding="utf-8") as f:
+				cached = json.load(f)
+			if cached.get("sha256") == mask_hash and cached.get("blue_rgb") == blue_key:
+				return [BlueZone(*zone) for zone in cached["zones"]]
+		except (OSError, ValueError, KeyError, TypeError):
+			pass
 
+	blue_zones = extract_blue_zones(mask_img, blue_rgb)
+	try:
+		with open(cache_path, "w", encoding="utf-8") as f:
+			json.dump({"sha256": mask_hash, "blue_rgb": blue_key, "zones": [list(z) for z in blue_zones]}, f)
+	except OSError as e:
+		print(f"⚠️ Could not write blue zone cache {cache_path}: {e}")
 	return blue_zones
 
 ### 🧩 Prefab Metadata Loader: Loads size and difficulty for prefab2png center shift and tier coloring
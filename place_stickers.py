@@ -240,9 +240,10 @@ def place_stickers(config):
 	output_rwg = os.path.join(config.output_dir, "sticker_rwg_tiles_only.png")
 	output_stickers = os.path.join(config.output_dir, "stickers_only.png")
 	
-	base_img.save(output_overlay)
-	rwg_img.save(output_rwg)
-	sticker_only_img.save(output_stickers)
+	config.image_writer.save(base_img, output_overlay, "final")
+	config.image_writer.save(rwg_img, output_rwg, "layer")
+	config.image_writer.save(sticker_only_img, output_stickers, "layer")
+	config.image_writer.flush()
 	if debug_log:
 		debug_log.close()
 	
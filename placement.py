@@ -0,0 +1,74 @@
+# placement.py
+# 🧩 Label placement plans: each category's placement decisions, saved so style-only re-renders can skip passes 1–4
+
+import os
+import json
+import hashlib
+from render_cache import file_digest
+
+PLAN_VERSION = 2
+PLAN_DIR = "placement"
+
+# Plan entry "pass" values: where a POI's label ended up
+LABEL_PASSES = ("blue_zone", "1-3", "4")  # Boxed label with wedge (pass 4 = extended search)
+DIRECT_PASS = "direct"                    # Haloed text next to the dot (streets, player_starts)
+LEGEND_PASS = "legend"                    # No room: POI id on the dot, name goes to the legend
+DOT_PASS = "dot"                          # Streets/player_starts with no room: the dot only
+NUMBERED_PASSES = ("numbered", "numbered_fallback")  # --numbered-dots id boxes
+
+def placement_signature(config, category, points, display_names):
+	"""
+	Hash of everything label placement depends on: the category's points and
+	display names, the placement engine, font, canvas size, padding and label mask.
+	Colors, dot radius and halo/box styling are drawing-only and not part of it.
+	"""
+	payload = {
+		"version": PLAN_VERSION,
+		"category": category,
+		"points": [[poi_id, name, px, pz, display_names.get(name, name)] for poi_id, name, px, pz in points],
+		"placement": config.placement,
+		"numbered_dots": bool(config.args.numbered_dots),
+		"font": [os.path.basename(config.font_path or ""), file_digest(config.font_path), config.font_size],
+		"image_size": list(config.image_size),
+		"label_padding": config.label_padding,
+		"mask": config.mask_digest,
+	}
+	encoded = json.dumps(payload, sort_keys=True, default=_json_default).encode("utf-8")
+	return hashlib.sha256(encoded).hexdigest()
+
+def _json_default(value):
+	# Placement engines return NumPy scalars for box coordinates
+	if hasattr(value, "item"):
+		return value.item()
+	raise TypeError(f"Not JSON serializable: {type(value).__name__}")
+
+def plan_path(output_dir, category):
+	return os.path.join(output_dir, PLAN_DIR, f"{category}.json")
+
+### 🧩 Plan Writer: placement/<category>.json in the output folder
+def save_placement_plan(output_dir, plan):
+	path = plan_path(output_dir, plan["category"])
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	with open(path, "w", encoding="utf-8") as f:
+		json.dump(plan, f, default=_json_default)
+	return path
+
+### 🧩 Plan Reader: Loads a category's plan from a previous output folder (or its placement/ folder)
+def load_placement_plan(source, category, signature):
+	"""
+	Returns (plan, reason): the plan if it was made from the same placement inputs,
+	otherwise None and why it can't be reused.
+	"""
+	for path in (plan_path(source, category), os.path.join(source, f"{category}.json")):
+		if os.path.exists(path):
+			break
+	else:
+		return None, "no plan found"
+	try:
+		with open(path, encoding="utf-8") as f:
+			plan = json.load(f)
+	except (OSError, ValueError) as e:
+		return None, f"unreadable plan ({e})"
+	if plan.get("version") != PLAN_VERSION or plan.get("signature") != signature:
+		return None, "points, names, font, mask or placement settings changed"
+	return plan, None
@@ -1,6 +1,7 @@
 # render.py
 
 import os
+import io
 from PIL import Image, ImageDraw, ImageFont
 from filters import should_exclude, BLOCK_CATEGORY_ALIASES, CATEGORY_COLORS
 from block_parser import load_tts, load_block_names, load_block_colors
@@ -9,10 +10,17 @@ from labeler import (
 	get_text_box,
 	is_placeable,
 	find_label_position_in_blue_zone,
-	placed_bounding_boxes,
-	extended_green_zone_search
+	extended_green_zone_search,
+	get_font_metrics,
+	PlacementIndex,
+	FreeSpaceIndex,
+	BlueZoneIndex
 )
 from helper import try_green_zone_label
+from layers import save_layer, palettize
+from sprites import DotLayer
+from render_cache import file_digest
+from placement import PLAN_VERSION, LABEL_PASSES, DIRECT_PASS, LEGEND_PASS, DOT_PASS, placement_signature, load_placement_plan
 from block_analysis import categorize_surface, categorize_blocks
 '''
 # === Bounding box helper (optional future use) ===
@@ -158,25 +166,66 @@ def draw_label_text_only(draw, wrapped_lines, font, final_box, dot_color="black"
 
 	x1, y1, x2, y2 = final_box
 	label_w = x2 - x1
-	line_height = font.getbbox("Ay")[3] - font.getbbox("Ay")[1]
+	metrics = get_font_metrics(font)
+	line_height = metrics.line_height
 
 	draw.rounded_rectangle([x1, y1, x2, y2], radius=BOX_RADIUS, fill=LABEL_FILL, outline=dot_color, width=2)
 
 	for i, line in enumerate(wrapped_lines):
-		bbox = font.getbbox(line)
+		bbox = metrics.bbox(line)
 		text_w = bbox[2] - bbox[0]
 		ty = y1 + padding + i * line_height
 		tx = x1 + (label_w - text_w) // 2
 		draw.text((tx, ty), line, font=font, fill=dot_color)
 
-def render_category_layer(
+SPRITE_MARGIN = 3  # Room around cached label sprites for glyph overhang and the 1 px halo
+
+### 🧩 Cached Label Box: Pastes draw_label_text_only() output from the label sprite cache
+def paste_label_box(img, sprites, wrapped_lines, font, final_box, dot_color="black"):
+	x1, y1, x2, y2 = final_box
+	m = SPRITE_MARGIN
+	local_box = (m, m, x2 - x1 + m, y2 - y1 + m)
+	size = (x2 - x1 + 2 * m + 1, y2 - y1 + 2 * m + 1)
+	key = ("box", tuple(wrapped_lines), x2 - x1, y2 - y1, dot_color)
+	sprites.paste(img, key, font, size, (x1 - m, y1 - m),
+		lambda draw: draw_label_text_only(draw, wrapped_lines, font, local_box, dot_color))
+
+### 🧩 Cached Halo Text: White 1 px halo + colored text for streets/player_starts, rasterized once per label
+def paste_halo_text(img, sprites, lines, font, origin, color):
+	"""
+	Pastes the cached sprite where the layer is still empty. Over existing content the
+	halo passes are drawn in place instead: ImageDraw composites each pass onto what's
+	underneath, which a pre-rendered sprite can't reproduce.
+	"""
+	metrics = get_font_metrics(font)
+	line_height = metrics.line_height
+	m = SPRITE_MARGIN
+	right = max(metrics.bbox(line)[2] for line in lines)
+	bottom = (len(lines) - 1) * line_height + max(metrics.bbox(line)[3] for line in lines)
+
+	def draw_halo(draw, x=m, y=m):
+		for i, line in enumerate(lines):
+			ty = y + i * line_height
+			for ox in (-1, 0, 1):
+				for oy in (-1, 0, 1):
+					if ox or oy:
+						draw.text((x + ox, ty + oy), line, fill="white", font=font)
+			draw.text((x, ty), line, fill=color, font=font)
+
+	size = (right + 2 * m, bottom + 2 * m)
+	corner = (origin[0] - m, origin[1] - m)
+	region = img.crop((corner[0], corner[1], corner[0] + size[0], corner[1] + size[1]))
+	if region.getchannel("A").getbbox() is not None:
+		draw_halo(ImageDraw.Draw(img), *origin)
+		return
+	sprites.paste(img, ("halo", tuple(lines), color), font, size, corner, draw_halo)
+
+### 🧩 Label Placement: Runs passes 1–4 for a category and records every decision as a plan
+def place_category_labels(
 	category,
 	points,
 	config,
 	display_names,
-	tiers,
-	tier_colors,
-	legend_entries,
 	label_mask,
 	blue_zones,
 	red_rgb,
@@ -185,28 +234,34 @@ def render_category_layer(
 	numbered_dots=False
 ):
 	"""
-	Renders a single prefab category (e.g., streets, biome_desert) to dot and label PNG layers.
-	Returns the combined image path if combined output is enabled.
+	Decides where each POI's label goes without drawing anything. Returns a plan dict
+	({"version", "category", "signature", "numbered_dots", "entries"}) with one entry per
+	point, in draw order: poi_id, name, display, x, y, pass, and the label's lines, box
+	and origin where it has one. render_category_layer() draws a plan.
 	"""
-	print(f"Rendering layer '{category}' with {len(points)} points...")
 	dot_centers = [(px, pz) for _, _, px, pz in points]
 	from labeler import find_label_position_near_dot, find_label_position_in_blue_zone
 	result = False
-	points_img = Image.new("RGBA", config.image_size, (255, 255, 255, 0))
-	labels_img = Image.new("RGBA", config.image_size, (255, 255, 255, 0))
-	points_draw = ImageDraw.Draw(points_img)
-	labels_draw = ImageDraw.Draw(labels_img)
-	blue_zone_stack_tops = {}
+	blue_zone_index = BlueZoneIndex(blue_zones)
 	font = config.font
+	metrics = get_font_metrics(font)
 	occupied_boxes = []
-	label_infos = []
-	rejection_attempts = 0
+	entries = []
+	placement_index = None
+	plan = {
+		"version": PLAN_VERSION,
+		"category": category,
+		"signature": placement_signature(config, category, points, display_names),
+		"numbered_dots": bool(numbered_dots),
+		"entries": entries
+	}
+	if config.placement == "batched":
+		placement_index = PlacementIndex(label_mask, red_rgb, blue_rgb, dot_centers)
+	elif config.placement == "freespace":
+		placement_index = FreeSpaceIndex(label_mask, red_rgb, blue_rgb, dot_centers, config.image_size)
 	if numbered_dots:
 		for poi_id, name, px, pz in points:
-			# 1️⃣ Add to legend
-			legend_entries.append((poi_id, name, display_names.get(name, name)))
-	
-			# 2️⃣ Try green zone placement
+			# 1️⃣ Try green zone placement
 			result = None
 			if label_mask:
 				result = try_green_zone_label(
@@ -215,7 +270,7 @@ def render_category_layer(
 			else:
 				# Use extended fallback without mask
 				from helper import check_label_overlap
-				bbox = font.getbbox(poi_id)
+				bbox = metrics.bbox(poi_id)
 				text_w = bbox[2] - bbox[0]
 				text_h = bbox[3] - bbox[1]
 				pad = 4
@@ -230,49 +285,42 @@ def render_category_layer(
 					break
 			if result:
 				lx, ly, label_box = result
+				placement = "numbered"
 				log(f"✅ numbered-dots placed near dot for {poi_id}")
 			else:
 				# ⚠️ Fallback: center on the dot
-				bbox = font.getbbox(poi_id)
+				bbox = metrics.bbox(poi_id)
 				text_w = bbox[2] - bbox[0]
 				text_h = bbox[3] - bbox[1]
 				pad = 4
 				lx = px - text_w // 2
 				ly = pz - text_h // 2
 				label_box = (lx - pad, ly - pad, lx + text_w + pad, ly + text_h + pad)
+				placement = "numbered_fallback"
 				log(f"⚠️ numbered-dots fallback for {poi_id}")
-	
-			# 3️⃣ Draw box and text
-			labels_draw.rounded_rectangle(label_box, radius=4, fill="white", outline="black")
-			labels_draw.text((lx, ly), poi_id, fill="black", font=font)
-	
-			# 4️⃣ Optional: draw connector wedge
-			draw_label_wedge_only(labels_draw, px, pz, label_box)
-	
-			# 5️⃣ Track occupied area
+
+			# 2️⃣ Track occupied area
 			occupied_boxes.append(label_box)
-	
-		labels_path = os.path.join(config.output_dir, f"{category}_labels.png")
-		if points:
-			labels_img.save(labels_path)
-		return None, 0
+			entries.append(_plan_entry(poi_id, name, display_names.get(name, name), px, pz, placement, box=label_box, origin=(lx, ly)))
+		return plan
 
 	for poi_id, name, px, pz in points:
 		display = display_names.get(name, name)
-		tier = tiers.get(name, -1)
-		dot_color = tier_colors.get(tier, "#FF0000")
-		
-		# ✅ Always draw a dot for every POI
-		r = config.dot_radius
-		points_draw.ellipse((px - r - 1, pz - r - 1, px + r + 1, pz + r + 1), fill="white")
-		points_draw.ellipse((px - r, pz - r, px + r, pz + r), fill=dot_color)
-		
+
 		place_in_blue_zone = label_mask and label_mask.getpixel((px, pz)) == red_rgb
+		extended_result = None
 
 		if place_in_blue_zone:
 			result = find_label_position_in_blue_zone(
-				px, pz, display, font, blue_zones, blue_zone_stack_tops, label_mask, red_rgb
+				px, pz, display, font, blue_zone_index, label_mask, red_rgb
 			)
+		elif placement_index is not None and category not in ("player_starts", "streets"):
+			# Batched/free-space engines search passes 1-4 in one call; a pass 4 hit takes the extended branch below
+			result = placement_index.find_label_position(px, pz, display, font, log=log)
+			if result and result[4] == 4:
+				extended_result, result = result[:4], None
+			elif result:
+				result = result[:4]
 		elif category not in ("player_starts", "streets"):
 			result = find_label_position_near_dot(
 				px, pz, display, font, label_mask, red_rgb, blue_rgb, occupied_boxes, dot_centers, log=log
@@ -286,54 +334,37 @@ def render_category_layer(
 				final_box = get_text_box(text_x, text_y, wrapped_lines, font)
 				label_x, label_y = text_x, text_y
 				result = (label_x, label_y, wrapped_lines, final_box)
-				
+
 		if result and category not in ("player_starts", "streets"):
 			label_x, label_y, wrapped_lines, final_box = result
-			text_w = max((font.getbbox(line)[2] for line in wrapped_lines), default=0)
-			line_height = font.getbbox("Ay")[3] - font.getbbox("Ay")[1]
-			text_h = line_height * len(wrapped_lines)
-			label_infos.append({
-				"dot_x": px,
-				"dot_y": pz,
-				"wrapped_lines": wrapped_lines,
-				"final_box": final_box,
-				"dot_color": dot_color
-			})
 			log(f"✅ Label added to label_infos for {poi_id} via pass 1-3")
 			occupied_boxes.append(final_box)
-			placed_bounding_boxes.append((poi_id, category, final_box))
-			
-			if config.args.verbose and config.verbose_log_file:
-				tier_str = f" (Tier {tier})" if tier >= 0 else ""
-				config.verbose_log_file.write(f"{poi_id},{name},{display}{tier_str},{dot_color},rendered\n")
+			if placement_index is not None:
+				placement_index.add_box(final_box)
+			entries.append(_plan_entry(
+				poi_id, name, display, px, pz, "blue_zone" if place_in_blue_zone else "1-3",
+				lines=wrapped_lines, box=final_box, origin=(label_x, label_y)
+			))
 			continue
 
 		elif result and category in ("player_starts", "streets"):
-			line_height = font.getbbox("Ay")[3] - font.getbbox("Ay")[1]
-		
-			for i, line in enumerate(wrapped_lines):
-				ty = label_y + i * line_height
-				for ox in (-1, 0, 1):
-					for oy in (-1, 0, 1):
-						if ox or oy:
-							labels_draw.text((label_x + ox, ty + oy), line, fill="white", font=font)
-				labels_draw.text((label_x, ty), line, fill=dot_color, font=font)
-		
-			# Connector line
-			label_mid_y = label_y + (line_height * len(wrapped_lines)) // 2
-			text_w = max((font.getbbox(line)[2] for line in wrapped_lines), default=0)
-			anchor_x = label_x if label_x > px else label_x + text_w
-			labels_draw.line([(px, pz), (anchor_x, label_mid_y)], fill="white", width=4)
-			labels_draw.line([(px, pz), (anchor_x, label_mid_y)], fill=dot_color, width=2)
-		
 			occupied_boxes.append(final_box)
+			entries.append(_plan_entry(poi_id, name, display, px, pz, DIRECT_PASS, lines=wrapped_lines, box=final_box, origin=(label_x, label_y)))
+			continue
 
-			if config.args.verbose and config.verbose_log_file:
-				tier_str = f" (Tier {tier})" if tier >= 0 else ""
-				config.verbose_log_file.write(f"{poi_id},{name},{display}{tier_str},{dot_color},rendered\n")
+		# Streets and player_starts never take pass 4 or the legend: their dot is drawn without a label
+		if category in ("player_starts", "streets"):
+			entries.append(_plan_entry(poi_id, name, display, px, pz, DOT_PASS))
+			continue
 
 		# log missed placements for extended_green_zone_search
-		if not result and category not in ("player_starts", "streets"):
+		if placement_index is not None:
+			if place_in_blue_zone:
+				# No room in a blue zone: the engine's pass 4 stands in for extended_green_zone_search
+				extended_result = placement_index.find_label_position(px, pz, display, font, log=log, min_pass=4)
+				extended_result = extended_result and extended_result[:4]
+			result = extended_result
+		else:
 			result = extended_green_zone_search(
 				dot_px=px,
 				dot_pz=pz,
@@ -346,28 +377,170 @@ def render_category_layer(
 				dot_centers=dot_centers,
 				log=log
 			)
-		
-			if result:
-				log(f"✅ Label added to label_infos for {poi_id} via Pass 4")
-				label_x, label_y, wrapped_lines, final_box = result
-				label_infos.append({
-					"dot_x": px,
-					"dot_y": pz,
-					"wrapped_lines": wrapped_lines,
-					"final_box": final_box,
-					"dot_color": dot_color,
-					"pass4_debug": config.debug_extended
-				})
-				occupied_boxes.append(final_box)
-				placed_bounding_boxes.append((poi_id, category, final_box))
-		
-				if config.args.verbose and config.verbose_log_file:
-					tier_str = f" (Tier {tier})" if tier >= 0 else ""
-					config.verbose_log_file.write(f"{poi_id},{name},{display}{tier_str},{dot_color},rendered (pass4)\n")
-				continue
-		
-			# ⬇️ Final fallback only if Pass 4 also fails
-			legend_entries.append((poi_id, name, display_names.get(name, name)))
+
+		if result:
+			log(f"✅ Label added to label_infos for {poi_id} via Pass 4")
+			label_x, label_y, wrapped_lines, final_box = result
+			occupied_boxes.append(final_box)
+			if placement_index is not None:
+				placement_index.add_box(final_box)
+			entries.append(_plan_entry(poi_id, name, display, px, pz, "4", lines=wrapped_lines, box=final_box, origin=(label_x, label_y)))
+			continue
+
+		# ⬇️ Final fallback only if Pass 4 also fails
+		log(f"⚠️ Final fallback: POI_ID on dot for {poi_id}")
+		entries.append(_plan_entry(poi_id, name, display, px, pz, LEGEND_PASS))
+
+	return plan
+
+def _plan_entry(poi_id, name, display, px, pz, placement, lines=None, box=None, origin=None):
+	entry = {"poi_id": poi_id, "name": name, "display": display, "x": px, "y": pz, "pass": placement}
+	if lines is not None:
+		entry["lines"] = list(lines)
+	if box is not None:
+		entry["box"] = list(box)
+	if origin is not None:
+		entry["origin"] = list(origin)
+	return entry
+
+### 🧩 Layer Bounds: Canvas region a category's plan can draw into
+def layer_bounds(entries, config, metrics):
+	"""
+	Returns (x1, y1, x2, y2) covering every dot, label box, label text and connector
+	in the plan, with slack for outlines, halos and glyph overhang. Only --sparse
+	layers are rendered at this size; everything else uses the full canvas.
+	"""
+	width, height = config.image_size
+	if not getattr(config.args, "sparse", False):
+		return 0, 0, width, height
+	xs, ys = [], []
+	line_height = metrics.line_height
+	for entry in entries:
+		xs.append(entry["x"])
+		ys.append(entry["y"])
+		if entry.get("box"):
+			x1, y1, x2, y2 = entry["box"]
+			xs += [x1, x2]
+			ys += [y1, y2]
+		lines = entry.get("lines") or [entry["poi_id"]]
+		text_w = max(metrics.width(line) for line in lines)
+		text_h = line_height * len(lines)
+		x, y = entry["origin"] if entry.get("origin") else (entry["x"] - text_w // 2, entry["y"] - text_h // 2)
+		xs += [x, x + text_w]
+		ys += [y, y + text_h]
+	if not xs:
+		return 0, 0, 1, 1
+	slack = line_height + SPRITE_MARGIN + config.dot_radius + 4
+	x1, y1 = max(min(xs) - slack, 0), max(min(ys) - slack, 0)
+	x2, y2 = min(max(xs) + slack + 1, width), min(max(ys) + slack + 1, height)
+	if x1 >= x2 or y1 >= y2:
+		return 0, 0, 1, 1
+	return x1, y1, x2, y2
+
+### 🧩 Layer Drawing: Draws a category's dots and labels from its placement plan
+def render_category_layer(
+	category,
+	plan,
+	config,
+	tiers,
+	tier_colors,
+	legend_entries,
+	compositor=None
+):
+	"""
+	Renders a single prefab category (e.g., streets, biome_desert) to dot and label PNG layers,
+	drawing labels where its plan (see place_category_labels) put them.
+	Returns (combined_path, rejection_attempts, placed_boxes): combined_path is set only if
+	combined output is enabled, placed_boxes lists (poi_id, category, (x1, y1, x2, y2)).
+	With --combined, the layer's visible region is also passed to compositor.add()
+	(palettized like the layer files with --palette-layers).
+	"""
+	entries = plan["entries"]
+	print(f"Rendering layer '{category}' with {len(entries)} points...")
+	font = config.font
+	metrics = get_font_metrics(font)
+
+	# Draw in layer coordinates: the canvas starts at (ox, oy) on the map
+	bounds = layer_bounds(entries, config, metrics)
+	ox, oy = bounds[:2]
+	layer_size = (bounds[2] - ox, bounds[3] - oy)
+
+	def shift(box):
+		return box[0] - ox, box[1] - oy, box[2] - ox, box[3] - oy
+
+	dots = DotLayer(config.dot_radius)
+	labels_img = Image.new("RGBA", layer_size, (255, 255, 255, 0))
+	labels_draw = ImageDraw.Draw(labels_img)
+	placed_boxes = []
+	label_infos = []
+	rejection_attempts = 0
+	if plan["numbered_dots"]:
+		for entry in entries:
+			poi_id, px, pz = entry["poi_id"], entry["x"] - ox, entry["y"] - oy
+			lx, ly = entry["origin"][0] - ox, entry["origin"][1] - oy
+			label_box = shift(entry["box"])
+
+			# 1️⃣ Add to legend
+			legend_entries.append((poi_id, entry["name"], entry["display"]))
+
+			# 2️⃣ Draw box and text
+			labels_draw.rounded_rectangle(label_box, radius=4, fill="white", outline="black")
+			labels_draw.text((lx, ly), poi_id, fill="black", font=font)
+
+			# 3️⃣ Optional: draw connector wedge
+			draw_label_wedge_only(labels_draw, px, pz, label_box)
+
+		labels_path = os.path.join(config.output_dir, f"{category}_labels.png")
+		if entries:
+			save_layer(labels_img, labels_path, config, (ox, oy))
+		return None, 0, placed_boxes
+
+	for entry in entries:
+		poi_id, name, display = entry["poi_id"], entry["name"], entry["display"]
+		px, pz = entry["x"] - ox, entry["y"] - oy
+		placement = entry["pass"]
+		tier = tiers.get(name, -1)
+		dot_color = tier_colors.get(tier, "#FF0000")
+		tier_str = f" (Tier {tier})" if tier >= 0 else ""
+
+		# ✅ Always draw a dot for every POI (stamped in bulk after placement)
+		dots.add_dot(px, pz, dot_color)
+
+		if placement in LABEL_PASSES:
+			final_box = shift(entry["box"])
+			label_infos.append({
+				"dot_x": px,
+				"dot_y": pz,
+				"wrapped_lines": entry["lines"],
+				"final_box": final_box,
+				"dot_color": dot_color,
+				"pass4_debug": placement == "4" and config.debug_extended
+			})
+			placed_boxes.append((poi_id, category, tuple(entry["box"])))
+
+			if config.args.verbose and config.verbose_log_file:
+				status = "rendered (pass4)" if placement == "4" else "rendered"
+				config.verbose_log_file.write(f"{poi_id},{name},{display}{tier_str},{dot_color},{status}\n")
+
+		elif placement == DIRECT_PASS:
+			wrapped_lines = entry["lines"]
+			label_x, label_y = entry["origin"][0] - ox, entry["origin"][1] - oy
+			line_height = metrics.line_height
+			paste_halo_text(labels_img, config.label_sprites, wrapped_lines, font, (label_x, label_y), dot_color)
+
+			# Connector line
+			label_mid_y = label_y + (line_height * len(wrapped_lines)) // 2
+			text_w = max((metrics.width(line) for line in wrapped_lines), default=0)
+			anchor_x = label_x if label_x > px else label_x + text_w
+			labels_draw.line([(px, pz), (anchor_x, label_mid_y)], fill="white", width=4)
+			labels_draw.line([(px, pz), (anchor_x, label_mid_y)], fill=dot_color, width=2)
+
+			if config.args.verbose and config.verbose_log_file:
+				config.verbose_log_file.write(f"{poi_id},{name},{display}{tier_str},{dot_color},rendered\n")
+
+		elif placement == LEGEND_PASS:
+			# POI id on the dot, name in the legend
+			legend_entries.append((poi_id, name, display))
 			bbox = labels_draw.textbbox((0, 0), poi_id, font=font)
 			w, h = bbox[2] - bbox[0], bbox[3] - bbox[1]
 			pad = 4
@@ -377,33 +550,15 @@ def render_category_layer(
 				px + w // 2 + pad,
 				pz + h // 2 + pad
 			)
-			points_draw.rounded_rectangle(label_box, radius=4, fill="white", outline="black")
+			dots.add_box(label_box, radius=4, fill="white", outline="black")
 			labels_draw.text((px - w // 2, pz - h // 2), poi_id, fill="black", font=font)
-			log(f"⚠️ Final fallback: POI_ID on dot for {poi_id}")
 			rejection_attempts += 1
-		
+
 			if config.args.verbose and config.verbose_log_file:
-				tier_str = f" (Tier {tier})" if tier >= 0 else ""
 				config.verbose_log_file.write(
 					f"{poi_id},{name},{display}{tier_str},{dot_color},skipped (fallback to legend)\n"
 				)
 
-		# 🔢 If numbered-dots mode is enabled, draw POI_ID box too
-		if numbered_dots:
-			legend_entries.append((poi_id, name, display_names.get(name, name)))
-			bbox = font.getbbox(poi_id)
-			text_w = bbox[2] - bbox[0]
-			text_h = bbox[3] - bbox[1]
-			pad = 4
-			label_box = (
-				px - text_w // 2 - pad,
-				pz - text_h // 2 - pad,
-				px + text_w // 2 + pad,
-				pz + text_h // 2 + pad
-			)
-			labels_draw.rounded_rectangle(label_box, radius=4, fill="white", outline="black")
-			labels_draw.text((px - text_w // 2, pz - text_h // 2), poi_id, fill="black", font=font)
-		
 	# First pass: draw all wedges
 	for info in label_infos:
 		draw_label_wedge_only(
@@ -414,24 +569,158 @@ def render_category_layer(
 			dot_color="yellow" if info.get("pass4_debug") else info["dot_color"]
 		)
 		
-	# Second pass: draw all label text and dots
+	# Second pass: paste all label boxes from the sprite cache
 	for info in label_infos:
-		draw_label_text_only(
-			draw=labels_draw,
+		paste_label_box(
+			labels_img,
+			config.label_sprites,
 			wrapped_lines=info["wrapped_lines"],
 			font=font,
 			final_box=info["final_box"],
 			dot_color="yellow" if info.get("pass4_debug") else info["dot_color"]
 		)
+	points_img = dots.render(layer_size)
 	points_path = os.path.join(config.output_dir, f"{category}_points.png")
 	labels_path = os.path.join(config.output_dir, f"{category}_labels.png")
-	points_img.save(points_path)
-	labels_img.save(labels_path)
+	save_layer(points_img, points_path, config, (ox, oy))
+	save_layer(labels_img, labels_path, config, (ox, oy))
 
 	if config.args.combined:
 		combined = Image.alpha_composite(points_img, labels_img)
+		if compositor is not None:
+			bbox = combined.getchannel("A").getbbox()
+			if bbox:
+				piece = combined.crop(bbox)
+				if config.args.palette_layers:
+					piece = palettize(piece, lossy=config.args.palette_layers == "quantize")
+				compositor.add(piece, (ox + bbox[0], oy + bbox[1]))
+		if config.args.skip_category_combined:
+			return None, rejection_attempts, placed_boxes
 		combined_path = os.path.join(config.combined_dir, f"{category}_combined.png")
-		combined.save(combined_path)
-		return combined_path, rejection_attempts
+		save_layer(combined, combined_path, config, (ox, oy))
+		return combined_path, rejection_attempts, placed_boxes
+
+	return None, rejection_attempts, placed_boxes
 
-	return None, rejection_attempts
\ No newline at end of file
+### 🧩 Category Worker: Per-process state for rendering categories in parallel (--jobs)
+_worker_state = {}
+
+class LayerCollector:
+	"""Stands in for a LayerCompositor in workers: keeps (layer, offset) pairs to send back."""
+	def __init__(self):
+		self.layers = []
+
+	def add(self, layer, offset=(0, 0)):
+		self.layers.append((layer, offset))
+
+def init_category_worker(args, output_dir, combined_dir, mask_path, red_rgb, blue_rgb, display_names, tiers, tier_colors):
+	"""
+	Process-pool initializer: builds this worker's Config and loads the label mask once.
+	"""
+	from helper import Config
+	from parse import load_blue_zones
+
+	config = Config(args)
+	config.output_dir = output_dir
+	config.combined_dir = combined_dir
+
+	label_mask = None
+	blue_zones = []
+	if mask_path:
+		label_mask = Image.open(mask_path).convert("RGB")
+		blue_zones = load_blue_zones(mask_path, label_mask, blue_rgb)
+		config.mask_digest = file_digest(mask_path)
+
+	_worker_state.update(
+		config=config,
+		label_mask=label_mask,
+		blue_zones=blue_zones,
+		red_rgb=red_rgb,
+		blue_rgb=blue_rgb,
+		display_names=display_names,
+		tiers=tiers,
+		tier_colors=tier_colors
+	)
+
+### 🧩 Category Result: Renders one category with its logs, CSV rows, legend entries and layers buffered
+def render_category_result(config, category, points, display_names, tiers, tier_colors, label_mask, blue_zones, red_rgb, blue_rgb):
+	"""
+	Renders one category and returns everything it produced as a dict, so callers
+	(the serial loop, worker processes, the layer cache) can merge results in
+	category order. config.verbose_log_file and config.layer_entries are swapped
+	for per-category buffers while rendering and restored afterwards.
+	With --reuse-placement DIR, labels are drawn from the category's plan in DIR when
+	its placement inputs are unchanged; otherwise they are placed again.
+	"""
+	log_lines = []
+	legend_entries = []
+	collector = LayerCollector()
+	saved = (config.verbose_log_file, config.layer_entries)
+	config.verbose_log_file = io.StringIO() if config.args.verbose else None
+	config.layer_entries = {}
+	try:
+		plan = None
+		if config.args.reuse_placement:
+			signature = placement_signature(config, category, points, display_names)
+			plan, reason = load_placement_plan(config.args.reuse_placement, category, signature)
+			if plan is None:
+				log_lines.append(f"⚠️ Not reusing placement for {category}: {reason}")
+				print(f"⚠️ Placing '{category}' labels again: {reason}.")
+		if plan is None:
+			plan = place_category_labels(
+				category=category,
+				points=points,
+				config=config,
+				display_names=display_names,
+				label_mask=label_mask,
+				blue_zones=blue_zones,
+				red_rgb=red_rgb,
+				blue_rgb=blue_rgb,
+				log=log_lines.append,
+				numbered_dots=config.args.numbered_dots
+			)
+		combined_path, rejections, placed_boxes = render_category_layer(
+			category=category,
+			plan=plan,
+			config=config,
+			tiers=tiers,
+			tier_colors=tier_colors,
+			legend_entries=legend_entries,
+			compositor=collector
+		)
+		return {
+			"category": category,
+			"combined_path": combined_path,
+			"rejections": rejections,
+			"placed_boxes": placed_boxes,
+			"legend_entries": legend_entries,
+			"layer_entries": config.layer_entries,
+			"composite_layers": collector.layers,
+			"log_lines": log_lines,
+			"verbose_rows": config.verbose_log_file.getvalue() if config.verbose_log_file else "",
+			"plan": plan
+		}
+	finally:
+		config.verbose_log_file, config.layer_entries = saved
+
+def render_category_job(category, points):
+	"""
+	Renders one category inside a worker process and returns its result dict
+	once the layer files are written.
+	"""
+	state = _worker_state
+	config = state["config"]
+	result = render_category_result(
+		config,
+		category,
+		points,
+		state["display_names"],
+		state["tiers"],
+		state["tier_colors"],
+		state["label_mask"],
+		state["blue_zones"],
+		state["red_rgb"],
+		state["blue_rgb"]
+	)
+	config.image_writer.flush()
+	return result
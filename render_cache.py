@@ -0,0 +1,200 @@
+# render_cache.py
+# 🧩 Layer render cache: content-addressed per-category results, reused when nothing that affects them changed
+
+import os
+import json
+import time
+import shutil
+import hashlib
+from PIL import Image
+
+LAYER_CACHE_VERSION = 2
+ENTRY_NAME = "entry.json"
+STALE_TMP_SECONDS = 24 * 3600  # Staging folders left behind by interrupted runs
+
+# Modules whose code decides what a category layer looks like
+RENDER_SOURCES = ("render.py", "placement.py", "labeler.py", "sprites.py", "helper.py", "layers.py", "compositor.py", "filters.py")
+
+# CLI options that change a category's pixels, labels or legend entries
+RENDER_SETTINGS = ("placement", "numbered_dots", "mask", "combined", "sparse", "skip_category_combined", "extended_placement_debug", "text_size", "palette_layers")
+
+_digests = {}
+
+def file_digest(path):
+	"""SHA-256 of a file, memoized by (path, mtime, size). None if the file doesn't exist."""
+	if not path or not os.path.isfile(path):
+		return None
+	stat = os.stat(path)
+	key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+	if key not in _digests:
+		digest = hashlib.sha256()
+		with open(path, "rb") as f:
+			for chunk in iter(lambda: f.read(1 << 20), b""):
+				digest.update(chunk)
+		_digests[key] = digest.hexdigest()
+	return _digests[key]
+
+def code_fingerprint():
+	here = os.path.dirname(os.path.abspath(__file__))
+	return [file_digest(os.path.join(here, name)) for name in RENDER_SOURCES]
+
+def _copy(src, dst):
+	# Copies rather than hard links: a later save into a reused output folder would rewrite the cached file
+	os.makedirs(os.path.dirname(dst), exist_ok=True)
+	shutil.copyfile(src, dst)
+
+### 🧩 Layer Cache: Stores each category's layer files and render result under a hash of its inputs
+class LayerCache:
+	"""
+	A category's key hashes its points, the display names, tiers and tier colors
+	they use, plus everything shared by the run: label mask file, font file and size,
+	canvas size, render settings and the render code itself. Entries live in
+	<cache_dir>/layers/<key>/ with the layer PNGs (same relative paths as in the
+	output folder), the pieces blended into the combined map and entry.json.
+	New entries are staged during the run and committed after the image writer's
+	final flush; the least recently used entries are then pruned down to max_mb.
+	"""
+	def __init__(self, cache_dir, config, mask_path=None, max_mb=None):
+		self.root = os.path.join(cache_dir, "layers")
+		self.max_bytes = max_mb * 2**20 if max_mb else None
+		self.hits = 0
+		self.misses = 0
+		self._staged = []
+		args = config.args
+		self.base = {
+			"version": LAYER_CACHE_VERSION,
+			"code": code_fingerprint(),
+			"image_size": list(config.image_size),
+			"dot_radius": config.dot_radius,
+			"label_padding": config.label_padding,
+			"font": [config.font_path, file_digest(config.font_path), config.font_size],
+			"mask": file_digest(mask_path),
+			"settings": {name: getattr(args, name, None) for name in RENDER_SETTINGS},
+		}
+
+	def key(self, category, points, display_names, tiers, tier_colors):
+		names = sorted({name for _, name, _, _ in points})
+		used_tiers = sorted({tiers.get(name, -1) for name in names})
+		payload = dict(
+			self.base,
+			category=category,
+			points=[list(point) for point in points],
+			display_names={name: display_names.get(name) for name in names},
+			tiers={name: tiers.get(name) for name in names},
+			tier_colors={str(tier): tier_colors.get(tier) for tier in used_tiers},
+		)
+		encoded = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+		return hashlib.sha256(encoded).hexdigest()
+
+	def load(self, key, config):
+		"""
+		Restores a cached category into config.output_dir and returns its result dict
+		(same shape as render_category_result), or None on a miss.
+		"""
+		entry_dir = os.path.join(self.root, key)
+		entry_path = os.path.join(entry_dir, ENTRY_NAME)
+		if not os.path.exists(entry_path):
+			self.misses += 1
+			return None
+		with open(entry_path, encoding="utf-8") as f:
+			entry = json.load(f)
+		os.utime(entry_path)  # Recently used entries survive pruning
+
+		for rel, layer in entry["layer_entries"].items():
+			if layer["offset"] is not None:
+				_copy(os.path.join(entry_dir, "files", rel), os.path.join(config.output_dir, rel))
+
+		composite_layers = []
+		for i, offset in enumerate(entry["composite_offsets"]):
+			with Image.open(os.path.join(entry_dir, f"composite_{i}.png")) as img:
+				img.load()
+				composite_layers.append((img if img.mode == "P" else img.convert("RGBA"), tuple(offset)))
+
+		self.hits += 1
+		return {
+			"category": entry["category"],
+			"combined_path": os.path.join(config.output_dir, entry["combined_path"]) if entry["combined_path"] else None,
+			"rejections": entry["rejections"],
+			"placed_boxes": [(poi_id, category, tuple(box)) for poi_id, category, box in entry["placed_boxes"]],
+			"legend_entries": [tuple(item) for item in entry["legend_entries"]],
+			"layer_entries": entry["layer_entries"],
+			"composite_layers": composite_layers,
+			"log_lines": entry["log_lines"],
+			"verbose_rows": entry["verbose_rows"],
+			"plan": entry["plan"],
+			"cached": True,
+		}
+
+	def stage(self, key, result, config):
+		"""
+		Queues a freshly rendered category for the cache: its combined-map pieces go
+		to config.image_writer and its layer files are copied in commit().
+		"""
+		entry_dir = os.path.join(self.root, key)
+		if os.path.exists(os.path.join(entry_dir, ENTRY_NAME)):
+			return
+		tmp_dir = f"{entry_dir}.{os.getpid()}.tmp"
+		shutil.rmtree(tmp_dir, ignore_errors=True)
+		os.makedirs(tmp_dir)
+
+		for i, (img, _) in enumerate(result["composite_layers"]):
+			config.image_writer.save(img, os.path.join(tmp_dir, f"composite_{i}.png"), "layer", compress_level=1)
+
+		combined_path = result["combined_path"]
+		entry = {
+			"category": result["category"],
+			"combined_path": os.path.relpath(combined_path, config.output_dir) if combined_path else None,
+			"rejections": result["rejections"],
+			"placed_boxes": result["placed_boxes"],
+			"legend_entries": result["legend_entries"],
+			"layer_entries": result["layer_entries"],
+			"composite_offsets": [list(offset) for _, offset in result["composite_layers"]],
+			"log_lines": result["log_lines"],
+			"verbose_rows": result["verbose_rows"],
+			"plan": result["plan"],
+		}
+		self._staged.append((tmp_dir, entry_dir, entry))
+
+	def commit(self, config):
+		"""Finishes the staged entries once config.image_writer has been flushed, then prunes."""
+		staged, self._staged = self._staged, []
+		for tmp_dir, entry_dir, entry in staged:
+			for rel, layer in entry["layer_entries"].items():
+				if layer["offset"] is not None:
+					_copy(os.path.join(config.output_dir, rel), os.path.join(tmp_dir, "files", rel))
+			with open(os.path.join(tmp_dir, ENTRY_NAME), "w", encoding="utf-8") as f:
+				json.dump(entry, f)
+			try:
+				os.replace(tmp_dir, entry_dir)
+			except OSError:
+				shutil.rmtree(tmp_dir, ignore_errors=True)  # Another process stored the same key first
+		if self.max_bytes:
+			self.prune(self.max_bytes)
+
+	def prune(self, max_bytes):
+		"""Deletes least recently used entries until the cache fits in max_bytes."""
+		if not os.path.isdir(self.root):
+			return
+		entries = []
+		total = 0
+		for name in os.listdir(self.root):
+			path = os.path.join(self.root, name)
+			if name.endswith(".tmp"):
+				if time.time() - os.path.getmtime(path) > STALE_TMP_SECONDS:
+					shutil.rmtree(path, ignore_errors=True)
+				continue
+			entry_path = os.path.join(path, ENTRY_NAME)
+			if not os.path.exists(entry_path):
+				continue
+			size = sum(
+				os.path.getsize(os.path.join(root, file))
+				for root, _, files in os.walk(path)
+				for file in files
+			)
+			entries.append((os.path.getmtime(entry_path), size, path))
+			total += size
+		for _, size, path in sorted(entries):
+			if total <= max_bytes:
+				break
+			shutil.rmtree(path, ignore_errors=True)
+			total -= size
@@ -0,0 +1,62 @@
+# render_client.py
+# 🧩 Render client: minimal stub for submitting jobs to render_service.py and waiting on them
+
+import sys
+import json
+import time
+import argparse
+import urllib.request
+import urllib.error
+from render_service import DEFAULT_HOST, DEFAULT_PORT
+
+def request(url, payload=None):
+	data = json.dumps(payload).encode("utf-8") if payload is not None else None
+	req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+	try:
+		with urllib.request.urlopen(req) as response:
+			return json.loads(response.read())
+	except urllib.error.HTTPError as e:
+		return dict(json.loads(e.read() or b"{}"), http_status=e.code)
+
+def main():
+	parser = argparse.ArgumentParser(
+		description="Submit a render job to a running render_service.py. Options after -- are passed as main.py flags.",
+		usage="render_client.py [--url URL] [--status] [--no-wait] [-- main.py options]"
+	)
+	parser.add_argument("--url", default=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}", help="Service base URL")
+	parser.add_argument("--status", action="store_true", help="Print the service status (queue depth, timings) and exit")
+	parser.add_argument("--no-wait", action="store_true", help="Return right after the job is queued")
+	parser.add_argument("--output-dir", help="Output folder for this job (default: chosen by the service)")
+	argv = sys.argv[1:]
+	render_args = []
+	if "--" in argv:
+		split = argv.index("--")
+		argv, render_args = argv[:split], argv[split + 1:]
+	options = parser.parse_args(argv)
+
+	if options.status:
+		print(json.dumps(request(f"{options.url}/status"), indent=2))
+		return
+
+	payload = {"args": render_args}
+	if options.output_dir:
+		payload["output_dir"] = options.output_dir
+	submitted = request(f"{options.url}/jobs", payload)
+	if "id" not in submitted:
+		print(f"❌ Job rejected: {submitted.get('error')}")
+		sys.exit(1)
+	print(f"📨 Job {submitted['id']} queued (queue depth {submitted['queue_depth']})")
+	if options.no_wait:
+		return
+
+	while True:
+		job = request(f"{options.url}/jobs/{submitted['id']}")
+		if job["status"] in ("done", "failed"):
+			break
+		time.sleep(1)
+	print(json.dumps(job, indent=2))
+	if job["status"] != "done":
+		sys.exit(1)
+
+if __name__ == "__main__":
+	main()
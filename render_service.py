@@ -0,0 +1,246 @@
+# render_service.py
+# 🧩 Render service: a local HTTP daemon that keeps shared inputs warm and renders queued map jobs
+
+import os
+import json
+import time
+import queue
+import argparse
+import threading
+import itertools
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from helper import Config, get_args, plan_memory_budget
+from main import LABEL_MASK_PATH, load_version, output_suffix, load_shared_inputs, render_world
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_HISTORY = 200  # Finished jobs kept for GET /jobs/<id>
+
+### 🧩 Render Job: One queued CLI invocation and its timings
+class RenderJob:
+	def __init__(self, job_id, argv, args, output_dir=None):
+		self.id = job_id
+		self.argv = argv
+		self.args = args
+		self.output_dir = output_dir
+		self.status = "queued"
+		self.error = None
+		self.result = None
+		self.queued_at = time.time()
+		self.started_at = None
+		self.finished_at = None
+		self.load_seconds = None
+		self.warm = None
+
+	def to_dict(self):
+		return {
+			"id": self.id,
+			"status": self.status,
+			"argv": self.argv,
+			"output_dir": self.output_dir,
+			"error": self.error,
+			"result": self.result,
+			"warm_inputs": self.warm,
+			"timings": {
+				"wait_seconds": _elapsed(self.queued_at, self.started_at),
+				"load_seconds": self.load_seconds,
+				"render_seconds": _elapsed(self.started_at, self.finished_at),
+			},
+		}
+
+def _elapsed(start, end):
+	if start is None:
+		return None
+	return round((end or time.time()) - start, 3)
+
+def _mtime(path):
+	return os.path.getmtime(path) if path and os.path.exists(path) else None
+
+def _prefab_xml_stamp(prefab_dir):
+	"""
+	(count, newest mtime) of the .xml files load_prefab_metadata() reads, so edits
+	inside prefab folders (which don't touch the folder's own mtime) are noticed.
+	"""
+	count, newest = 0, None
+	for root, _, files in os.walk(prefab_dir or ""):
+		for file in files:
+			if file.endswith(".xml"):
+				mtime = os.stat(os.path.join(root, file)).st_mtime_ns
+				count += 1
+				newest = mtime if newest is None else max(newest, mtime)
+	return count, newest
+
+### 🧩 Render Service: Job queue, single render thread and warm shared-input cache
+class RenderService:
+	"""
+	Jobs carry the same argv as main.py and run one at a time on a worker thread
+	(each job can still use --jobs worker processes). Shared inputs (prefab metadata,
+	localization, tier colors, font, label mask + blue zones) are cached by their
+	paths, modification times (of every prefab .xml) and font settings, so repeated
+	jobs skip the cold start.
+	Label sprite caches are kept per --cache-dir. Only the last `history` finished
+	jobs are kept; older ones are dropped and GET /jobs/<id> returns 404 for them.
+	"""
+	def __init__(self, history=DEFAULT_HISTORY):
+		self.version = load_version()
+		self.history = history
+		self.jobs = OrderedDict()
+		self.evicted = 0
+		self.queue = queue.Queue()
+		self.lock = threading.Lock()
+		self.ids = itertools.count(1)
+		self.shared_inputs = {}
+		self.label_sprites = {}
+		self.current = None
+		self.started_at = time.time()
+		self.worker = threading.Thread(target=self._run, name="render-worker", daemon=True)
+		self.worker.start()
+
+	def submit(self, argv, output_dir=None):
+		"""Parses argv like main.py (SystemExit on invalid options) and queues the job."""
+		args = get_args(argv)
+		with self.lock:
+			job = RenderJob(next(self.ids), argv, args, output_dir)
+			self.jobs[job.id] = job
+		self.queue.put(job)
+		return job
+
+	def job(self, job_id):
+		with self.lock:
+			return self.jobs.get(job_id)
+
+	def _trim_history(self):
+		"""Drops the oldest finished jobs beyond self.history (queued and running jobs stay)."""
+		with self.lock:
+			finished = [job_id for job_id, job in self.jobs.items() if job.status in ("done", "failed")]
+			for job_id in finished[:max(len(finished) - self.history, 0)]:
+				del self.jobs[job_id]
+				self.evicted += 1
+
+	def status(self):
+		with self.lock:
+			jobs = list(self.jobs.values())
+		done = [job for job in jobs if job.status == "done"]
+		render_times = [job.finished_at - job.started_at for job in done]
+		return {
+			"version": self.version,
+			"uptime_seconds": round(time.time() - self.started_at, 1),
+			"queue_depth": self.queue.qsize(),
+			"running": self.current.id if self.current else None,
+			"jobs": {state: sum(job.status == state for job in jobs) for state in ("queued", "running", "done", "failed")},
+			"jobs_evicted": self.evicted,
+			"average_render_seconds": round(sum(render_times) / len(render_times), 3) if render_times else None,
+			"warm_input_sets": len(self.shared_inputs),
+			"label_sprites_cached": sum(len(cache.sprites) for cache in self.label_sprites.values()),
+		}
+
+	def _shared_inputs_for(self, config, args):
+		key = (
+			config.prefab_dir, _prefab_xml_stamp(config.prefab_dir),
+			config.localization_path, _mtime(config.localization_path),
+			bool(args.mask), _mtime(LABEL_MASK_PATH) if args.mask else None,
+			config.font_path, config.font_size,
+		)
+		shared = self.shared_inputs.get(key)
+		if shared is None:
+			shared = self.shared_inputs[key] = load_shared_inputs(config, args)
+			return shared, False
+		return shared, True
+
+	def _run(self):
+		while True:
+			job = self.queue.get()
+			self.current = job
+			job.status = "running"
+			job.started_at = time.time()
+			config = None
+			try:
+				args = job.args
+				config = Config(args)
+				args.world_size = config.world_size
+				plan_memory_budget(args, config.image_size)
+				config.output_dir = job.output_dir or f"output--{self.version}--{output_suffix(args)}--job{job.id}"
+				job.output_dir = config.output_dir
+
+				loading = time.time()
+				shared, job.warm = self._shared_inputs_for(config, args)
+				job.load_seconds = round(time.time() - loading, 3)
+				config.label_sprites = self.label_sprites.setdefault(config.cache_dir, config.label_sprites)
+
+				job.result = render_world(config, shared, self.version)
+				job.status = "done"
+			except Exception as e:
+				job.status = "failed"
+				job.error = f"{type(e).__name__}: {e}"
+				print(f"❌ Job {job.id} failed: {job.error}")
+			finally:
+				if config is not None:
+					config.image_writer.close()
+				job.finished_at = time.time()
+				self.current = None
+				print(f"🕒 Job {job.id} {job.status} in {job.finished_at - job.started_at:.2f} seconds")
+				self._trim_history()
+
+### 🧩 HTTP API: POST /jobs, GET /jobs/<id>, GET /status
+class RenderRequestHandler(BaseHTTPRequestHandler):
+	service = None
+
+	def _send(self, code, payload):
+		body = json.dumps(payload, indent=2).encode("utf-8")
+		self.send_response(code)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def do_GET(self):
+		if self.path == "/status":
+			return self._send(200, self.service.status())
+		if self.path.startswith("/jobs/"):
+			try:
+				job = self.service.job(int(self.path[len("/jobs/"):]))
+			except ValueError:
+				job = None
+			if job is None:
+				return self._send(404, {"error": "unknown job"})
+			return self._send(200, job.to_dict())
+		self._send(404, {"error": f"unknown path {self.path}"})
+
+	def do_POST(self):
+		if self.path != "/jobs":
+			return self._send(404, {"error": f"unknown path {self.path}"})
+		try:
+			length = int(self.headers.get("Content-Length", 0))
+			request = json.loads(self.rfile.read(length) or b"{}")
+			argv = [str(arg) for arg in request.get("args", [])]
+		except (ValueError, AttributeError, TypeError) as e:
+			return self._send(400, {"error": f"invalid request: {e}"})
+		try:
+			job = self.service.submit(argv, request.get("output_dir"))
+		except SystemExit:
+			return self._send(400, {"error": "invalid render options", "args": argv})
+		self._send(202, {"id": job.id, "status": job.status, "queue_depth": self.service.queue.qsize()})
+
+	def log_message(self, format, *args):
+		pass
+
+def main():
+	parser = argparse.ArgumentParser(description="Run a local prefab2png render service")
+	parser.add_argument("--host", default=DEFAULT_HOST, help=f"Interface to listen on (default: {DEFAULT_HOST})")
+	parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port to listen on (default: {DEFAULT_PORT})")
+	parser.add_argument("--history", type=int, default=DEFAULT_HISTORY, help=f"Finished jobs to keep for GET /jobs/<id> (default: {DEFAULT_HISTORY})")
+	options = parser.parse_args()
+
+	RenderRequestHandler.service = RenderService(max(options.history, 0))
+	server = ThreadingHTTPServer((options.host, options.port), RenderRequestHandler)
+	print(f"🛰️ prefab2png render service listening on http://{options.host}:{options.port}")
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		print("\n👋 Shutting down render service.")
+	finally:
+		server.server_close()
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,242 @@
+# sprites.py
+# 🧩 Sprites: anti-aliased POI dots stamped in bulk, and a cache of rasterized labels
+
+import os
+import hashlib
+import numpy as np
+import PIL
+from functools import lru_cache
+from PIL import Image, ImageDraw
+from compositor import blend_over
+from labeler import font_cache_key
+
+SUPERSAMPLE = 4
+LABEL_SPRITE_VERSION = 1
+
+### 🧩 Dot Sprite: White-ringed colored dot, drawn supersampled and reduced for anti-aliasing
+@lru_cache(maxsize=None)
+def dot_sprite(color, radius, ring="white"):
+	"""
+	Returns a premultiplied (RGBa) uint8 array of shape (S, S, 4), S = 2 * radius + 3,
+	centered on its middle pixel. Matches the footprint of the old pair of ellipses:
+	a ring of radius + 1 with the colored dot of radius on top.
+	"""
+	size = 2 * radius + 3
+	big = Image.new("RGBA", (size * SUPERSAMPLE, size * SUPERSAMPLE), (0, 0, 0, 0))
+	draw = ImageDraw.Draw(big)
+	draw.ellipse((0, 0, size * SUPERSAMPLE - 1, size * SUPERSAMPLE - 1), fill=ring)
+	draw.ellipse((SUPERSAMPLE, SUPERSAMPLE, (size - 1) * SUPERSAMPLE - 1, (size - 1) * SUPERSAMPLE - 1), fill=color)
+	sprite = np.asarray(big.convert("RGBa").reduce(SUPERSAMPLE))
+	sprite.setflags(write=False)
+	return sprite
+
+def overlapping_pairs(xs, ys, size):
+	"""
+	Returns (earlier, later) index arrays for every pair of size x size stamps that
+	overlap. Stamps are sorted into size-wide grid cells, so each stamp is only
+	compared with its own cell and the neighboring cells after it.
+	"""
+	cx, cy = xs // size, ys // size
+	cx, cy = cx - cx.min(), cy - cy.min() + 1
+	stride = int(cy.max()) + 2
+	order = np.argsort(cx * stride + cy, kind="stable")
+	cells = (cx * stride + cy)[order]
+	sx, sy = xs[order], ys[order]
+	position = np.arange(len(cells))
+	earlier, later = [], []
+	for step in (0, 1, stride - 1, stride, stride + 1):
+		start = np.searchsorted(cells, cells + step, "left")
+		if step == 0:
+			start = position + 1  # Same cell: each pair once
+		counts = np.searchsorted(cells, cells + step, "right") - start
+		src = np.repeat(position, counts)
+		dst = np.repeat(start - np.cumsum(counts) + counts, counts) + np.arange(len(src))
+		keep = (np.abs(sx[src] - sx[dst]) < size) & (np.abs(sy[src] - sy[dst]) < size)
+		a, b = order[src[keep]], order[dst[keep]]
+		earlier.append(np.minimum(a, b))
+		later.append(np.maximum(a, b))
+	return np.concatenate(earlier), np.concatenate(later)
+
+def overlap_passes(xs, ys, size):
+	"""
+	Splits stamps into passes so that no two stamps in a pass overlap, while any
+	two overlapping stamps keep their original order (later pass = drawn later).
+	A stamp's pass is the length of the longest chain of earlier stamps overlapping
+	it, relaxed over all overlapping pairs at once until nothing changes.
+	"""
+	passes = np.zeros(len(xs), dtype=np.int32)
+	if len(xs) < 2:
+		return passes
+	earlier, later = overlapping_pairs(np.asarray(xs, dtype=np.int64), np.asarray(ys, dtype=np.int64), size)
+	while len(earlier):
+		relaxed = passes.copy()
+		np.maximum.at(relaxed, later, passes[earlier] + 1)
+		if np.array_equal(relaxed, passes):
+			break
+		passes = relaxed
+	return passes
+
+### 🧩 Dot Layer: Records dots (and opaque boxes drawn between them) and renders them in draw order
+class DotLayer:
+	"""
+	Collects the points layer's dots in draw order. render() stamps every dot
+	sprite with vectorized premultiplied blending, one pass per overlap level,
+	into a buffer covering only the dots' bounding box. Boxes added with add_box()
+	(e.g. the POI-id fallback) are drawn between the dots that came before and after.
+	"""
+	def __init__(self, radius):
+		self.radius = radius
+		self.size = 2 * radius + 3
+		self.segments = [[]]
+		self.boxes = []
+
+	def add_dot(self, x, y, color):
+		self.segments[-1].append((x, y, color))
+
+	def add_box(self, box, **style):
+		"""Queues draw.rounded_rectangle(box, **style) after all dots added so far."""
+		self.boxes.append((box, style))
+		self.segments.append([])
+
+	def _bbox(self, canvas_size):
+		half = self.radius + 1
+		xs, ys = [], []
+		for segment in self.segments:
+			for x, y, _ in segment:
+				xs += [x - half, x + half + 1]
+				ys += [y - half, y + half + 1]
+		for box, _ in self.boxes:
+			xs += [box[0], box[2] + 1]
+			ys += [box[1], box[3] + 1]
+		if not xs:
+			return None
+		x1, y1 = max(min(xs), 0), max(min(ys), 0)
+		x2, y2 = min(max(xs), canvas_size[0]), min(max(ys), canvas_size[1])
+		if x1 >= x2 or y1 >= y2:
+			return None
+		return x1, y1, x2, y2
+
+	def _stamp(self, buffer, origin, segment):
+		xs = np.array([x for x, _, _ in segment], dtype=np.int64)
+		ys = np.array([y for _, y, _ in segment], dtype=np.int64)
+		colors = [color for _, _, color in segment]
+		palette = list(dict.fromkeys(colors))
+		sprites = np.stack([dot_sprite(color, self.radius) for color in palette])
+		color_ids = np.array([palette.index(color) for color in colors]) if len(palette) > 1 else np.zeros(len(colors), dtype=np.intp)
+
+		half = self.radius + 1
+		grid = np.arange(self.size)
+		height, width = buffer.shape[:2]
+		passes = overlap_passes(xs, ys, self.size)
+		for level in range(passes.max() + 1):
+			idx = np.flatnonzero(passes == level)
+			rows = (ys[idx] - half - origin[1])[:, None, None] + grid[None, :, None]
+			cols = (xs[idx] - half - origin[0])[:, None, None] + grid[None, None, :]
+			rows, cols = np.broadcast_arrays(rows, cols)
+			valid = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+			src = sprites[color_ids[idx]][valid]
+			rows, cols = rows[valid], cols[valid]
+			dst = buffer[rows, cols]
+			blend_over(dst, src)
+			buffer[rows, cols] = dst
+
+	def _draw_box(self, buffer, origin, box, style):
+		height, width = buffer.shape[:2]
+		x1, y1 = max(box[0] - origin[0], 0), max(box[1] - origin[1], 0)
+		x2, y2 = min(box[2] - origin[0] + 1, width), min(box[3] - origin[1] + 1, height)
+		if x1 >= x2 or y1 >= y2:
+			return
+		region = Image.fromarray(buffer[y1:y2, x1:x2], "RGBa").convert("RGBA")
+		local = (box[0] - origin[0] - x1, box[1] - origin[1] - y1, box[2] - origin[0] - x1, box[3] - origin[1] - y1)
+		ImageDraw.Draw(region).rounded_rectangle(local, **style)
+		buffer[y1:y2, x1:x2] = np.asarray(region.convert("RGBa"))
+
+	def render(self, canvas_size):
+		"""Returns the RGBA points layer for a canvas of canvas_size."""
+		canvas = Image.new("RGBA", canvas_size, (255, 255, 255, 0))
+		bbox = self._bbox(canvas_size)
+		if bbox is None:
+			return canvas
+		origin = bbox[:2]
+		buffer = np.zeros((bbox[3] - bbox[1], bbox[2] - bbox[0], 4), dtype=np.uint8)
+		for i, segment in enumerate(self.segments):
+			if segment:
+				self._stamp(buffer, origin, segment)
+			if i < len(self.boxes):
+				self._draw_box(buffer, origin, *self.boxes[i])
+		canvas.paste(Image.fromarray(buffer, "RGBa").convert("RGBA"), origin)
+		return canvas
+
+### 🧩 Label Sprite Cache: Rasterizes each distinct label once and pastes it wherever it repeats
+class LabelSpriteCache:
+	"""
+	Caches label drawings (boxed labels, halo text) as (sprite, replace mask) pairs.
+	Each label is drawn over transparent black and over opaque white: pixels that
+	match were overwritten by the drawing (e.g. box fills) and are pasted as is,
+	the rest is alpha-composited, which is what ImageDraw does for RGBA text.
+	Sprites for TrueType fonts are also kept on disk in cache_dir as .npz.
+	"""
+	def __init__(self, cache_dir=None):
+		self.cache_dir = cache_dir
+		self.sprites = {}
+		self.hits = 0
+		self.misses = 0
+		if cache_dir:
+			os.makedirs(cache_dir, exist_ok=True)
+
+	def _disk_path(self, key):
+		if not self.cache_dir or not (isinstance(key[0], tuple) and isinstance(key[0][0], str)):
+			return None  # Fonts not loaded from a file path have no key that survives the process
+		digest = hashlib.sha1(repr((LABEL_SPRITE_VERSION, PIL.__version__, key)).encode("utf-8")).hexdigest()
+		return os.path.join(self.cache_dir, f"{digest}.npz")
+
+	def get(self, key, font, size, draw_fn):
+		"""
+		Returns (sprite RGBA, mask L) for key drawn in font, calling draw_fn(ImageDraw)
+		on a size canvas on a miss.
+		"""
+		key = (font_cache_key(font),) + tuple(key)
+		cached = self.sprites.get(key)
+		if cached is not None:
+			self.hits += 1
+			return cached
+
+		path = self._disk_path(key)
+		if path and os.path.exists(path):
+			with np.load(path) as data:
+				cached = (Image.fromarray(data["sprite"], "RGBA"), Image.fromarray(data["mask"], "L"))
+			self.hits += 1
+		else:
+			cached = self._rasterize(size, draw_fn)
+			self.misses += 1
+			if path:
+				tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+				np.savez_compressed(tmp_path, sprite=np.asarray(cached[0]), mask=np.asarray(cached[1]))
+				os.replace(tmp_path, path)
+		self.sprites[key] = cached
+		return cached
+
+	@staticmethod
+	def _rasterize(size, draw_fn):
+		on_clear = Image.new("RGBA", size, (0, 0, 0, 0))
+		on_white = Image.new("RGBA", size, (255, 255, 255, 255))
+		draw_fn(ImageDraw.Draw(on_clear))
+		draw_fn(ImageDraw.Draw(on_white))
+
+		# Pixels that come out the same on both backgrounds were overwritten (box fills);
+		# everything else was alpha-composited (text, outlines' anti-aliasing)
+		same = np.all(np.asarray(on_clear) == np.asarray(on_white), axis=-1)
+		return on_clear, Image.fromarray(same.astype(np.uint8) * 255, "L")
+
+	def paste(self, img, key, font, size, origin, draw_fn):
+		"""Composites the sprite over img at origin, then pastes its overwritten pixels as drawn."""
+		sprite, replace = self.get(key, font, size, draw_fn)
+		x, y = origin
+		if x < 0 or y < 0:
+			crop = (max(-x, 0), max(-y, 0), sprite.width, sprite.height)
+			sprite, replace = sprite.crop(crop), replace.crop(crop)
+			x, y = max(x, 0), max(y, 0)
+		if x >= img.width or y >= img.height or sprite.width == 0 or sprite.height == 0:
+			return
+		img.alpha_composite(sprite, (x, y))
+		img.paste(sprite, (x, y), replace)